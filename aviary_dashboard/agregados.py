@@ -0,0 +1,160 @@
+import threading
+from datetime import timedelta
+
+# Resoluções disponíveis (nome -> duração do intervalo em segundos)
+RESOLUCOES = {"1m": 60, "15m": 900, "1h": 3600}
+
+FORMATO_CHAVE = "%Y%m%d_%H%M%S"
+TAMANHO_CHAVE = 15  # len("AAAAMMDD_HHMMSS")
+
+
+def inicio_intervalo(instante, segundos):
+    # Início do intervalo alinhado à meia-noite (as durações dividem 24 h)
+    meia_noite = instante.replace(hour=0, minute=0, second=0, microsecond=0)
+    decorridos = instante.hour * 3600 + instante.minute * 60 + instante.second
+    return meia_noite + timedelta(seconds=decorridos // segundos * segundos)
+
+
+class _Intervalo:
+    __slots__ = ("inicio", "estatisticas")
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.estatisticas = {}  # campo -> [min, max, soma, contagem]
+
+    def acumular(self, campo, valor):
+        estatistica = self.estatisticas.get(campo)
+        if estatistica is None:
+            self.estatisticas[campo] = [valor, valor, valor, 1]
+        else:
+            if valor < estatistica[0]:
+                estatistica[0] = valor
+            if valor > estatistica[1]:
+                estatistica[1] = valor
+            estatistica[2] += valor
+            estatistica[3] += 1
+
+    def resumo(self):
+        registo = {
+            campo: {"min": minimo, "max": maximo, "media": soma / contagem, "contagem": contagem}
+            for campo, (minimo, maximo, soma, contagem) in self.estatisticas.items()
+        }
+        registo["timestamp"] = self.inicio.strftime("%H:%M:%S")
+        return registo
+
+
+def juntar_resumos(resumos):
+    # Resumo de um intervalo a partir dos resumos parciais (de vários processos)
+    estatisticas = {}
+    timestamp = None
+    for resumo in resumos:
+        for campo, valor in resumo.items():
+            if campo == "timestamp":
+                timestamp = valor
+                continue
+            atual = estatisticas.get(campo)
+            soma = valor["media"] * valor["contagem"]
+            if atual is None:
+                estatisticas[campo] = [valor["min"], valor["max"], soma, valor["contagem"]]
+            else:
+                atual[0] = min(atual[0], valor["min"])
+                atual[1] = max(atual[1], valor["max"])
+                atual[2] += soma
+                atual[3] += valor["contagem"]
+    registo = {
+        campo: {"min": minimo, "max": maximo, "media": soma / contagem, "contagem": contagem}
+        for campo, (minimo, maximo, soma, contagem) in estatisticas.items()
+    }
+    registo["timestamp"] = timestamp
+    return registo
+
+
+def juntar_partes(registos):
+    # Agrupa registos (chave, resumo) ordenados, em que a chave é o início do
+    # intervalo seguido opcionalmente de "_<parte>", num registo por intervalo
+    juntos = []
+    for chave, resumo in registos:
+        inicio = chave[:TAMANHO_CHAVE]
+        if juntos and juntos[-1][0] == inicio:
+            juntos[-1][1].append(resumo)
+        else:
+            juntos.append((inicio, [resumo]))
+    return [(inicio, resumos[0] if len(resumos) == 1 else juntar_resumos(resumos))
+            for inicio, resumos in juntos]
+
+
+# Agregação do histórico em várias resoluções (min/max/média/contagem por campo
+# e por intervalo). Os campos binários entram como 0/1, pelo que a média é a
+# fração do intervalo em que estiveram ativos. Quando chega um registo de um
+# intervalo posterior, o anterior fecha e é entregue a `persistir(resolucao,
+# chave, resumo)`; a chave tem o formato das chaves do histórico, por isso os
+# parâmetros from/to funcionam da mesma forma.
+#
+# Com `parte`, cada processo persiste só o seu resumo parcial, com a chave
+# "<início>_<parte>": vários processos de ingestão (subscrições partilhadas, ou
+# o processo antes e depois de um reinício ou failover) contribuem para o mesmo
+# intervalo sem se sobreporem, e a leitura junta as partes com juntar_partes.
+class Agregador:
+    def __init__(self, campos, persistir, resolucoes=RESOLUCOES, parte=None):
+        self._campos = tuple(campos)
+        self._persistir = persistir
+        self.resolucoes = dict(resolucoes)
+        self._parte = parte
+        self._sufixo = f"_{parte}" if parte else ""
+        self._descargas = 0
+        self._abertos = {}
+        self._lock = threading.Lock()
+        self.registos = 0
+        self.fechados = 0
+        self.descarregados = 0
+
+    def adicionar(self, instante, registo):
+        fechados = []
+        with self._lock:
+            self.registos += 1
+            for resolucao, segundos in self.resolucoes.items():
+                inicio = inicio_intervalo(instante, segundos)
+                aberto = self._abertos.get(resolucao)
+                if aberto is None or aberto.inicio != inicio:
+                    if aberto is not None:
+                        fechados.append((resolucao, aberto))
+                    aberto = self._abertos[resolucao] = _Intervalo(inicio)
+                for campo in self._campos:
+                    valor = registo.get(campo)
+                    if isinstance(valor, (int, float)):
+                        aberto.acumular(campo, float(valor))
+            self.fechados += len(fechados)
+        for resolucao, intervalo in fechados:
+            self._persistir(resolucao, intervalo.inicio.strftime(FORMATO_CHAVE) + self._sufixo, intervalo.resumo())
+
+    def descarregar(self):
+        # Persiste já os intervalos em curso (ao terminar o processo ou ao perder
+        # a liderança). Os registos seguintes vão para uma parte nova, para que o
+        # resto do intervalo não substitua o que foi agora persistido
+        with self._lock:
+            abertos = list(self._abertos.items())
+            self._abertos.clear()
+            sufixo = self._sufixo
+            if abertos and self._parte:
+                self._descargas += 1
+                self._sufixo = f"_{self._parte}-{self._descargas}"
+            self.descarregados += len(abertos)
+        for resolucao, intervalo in abertos:
+            self._persistir(resolucao, intervalo.inicio.strftime(FORMATO_CHAVE) + sufixo, intervalo.resumo())
+
+    def aberto(self, resolucao):
+        # Intervalo ainda em curso (não persistido), como (chave, resumo) ou None
+        with self._lock:
+            intervalo = self._abertos.get(resolucao)
+            if intervalo is None:
+                return None
+            return intervalo.inicio.strftime(FORMATO_CHAVE), intervalo.resumo()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "resolucoes": list(self.resolucoes),
+                "registos": self.registos,
+                "intervalos_fechados": self.fechados,
+                "intervalos_descarregados": self.descarregados,
+            }
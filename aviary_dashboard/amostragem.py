@@ -0,0 +1,62 @@
+import math
+
+
+def _normalizar(coluna):
+    # Escala a coluna para [0, 1] (None/NaN -> None) para que sensores com
+    # amplitudes diferentes pesem o mesmo na escolha dos pontos
+    validos = [v for v in coluna if v is not None and not math.isnan(v)]
+    if not validos:
+        return None
+    minimo, maximo = min(validos), max(validos)
+    escala = (maximo - minimo) or 1.0
+    return [None if v is None or math.isnan(v) else (v - minimo) / escala for v in coluna]
+
+
+def _media(coluna, inicio, fim):
+    valores = [v for v in coluna[inicio:fim] if v is not None]
+    return sum(valores) / len(valores) if valores else None
+
+
+# Largest-Triangle-Three-Buckets sobre várias séries em simultâneo: devolve os
+# índices (sempre o primeiro e o último) a manter para desenhar `n_pontos`.
+# Em cada balde escolhe-se o ponto que forma o maior triângulo com o ponto
+# escolhido no balde anterior e a média do balde seguinte, somando a área de
+# todas as colunas normalizadas. O eixo x é a posição do registo.
+def lttb_indices(colunas, n_pontos):
+    total = len(colunas[0]) if colunas else 0
+    if n_pontos >= total or n_pontos < 3:
+        return list(range(total))
+    colunas = [c for c in (_normalizar(coluna) for coluna in colunas) if c is not None]
+    if not colunas:
+        # Sem valores numéricos: amostragem uniforme
+        passo = (total - 1) / (n_pontos - 1)
+        return sorted({round(i * passo) for i in range(n_pontos)})
+
+    tamanho_balde = (total - 2) / (n_pontos - 2)
+    escolhidos = [0]
+    anterior = 0
+    for balde in range(n_pontos - 2):
+        inicio = int(balde * tamanho_balde) + 1
+        fim = int((balde + 1) * tamanho_balde) + 1
+        seguinte_fim = min(int((balde + 2) * tamanho_balde) + 1, total)
+        if balde == n_pontos - 3:
+            seguinte_inicio, seguinte_fim = total - 1, total
+        else:
+            seguinte_inicio = fim
+        media_x = (seguinte_inicio + seguinte_fim - 1) / 2
+        medias_y = [_media(coluna, seguinte_inicio, seguinte_fim) for coluna in colunas]
+
+        melhor, maior_area = inicio, -1.0
+        for j in range(inicio, fim):
+            area = 0.0
+            for coluna, media_y in zip(colunas, medias_y):
+                y_anterior, y = coluna[anterior], coluna[j]
+                if y_anterior is None or y is None or media_y is None:
+                    continue
+                area += abs((anterior - media_x) * (y - y_anterior) - (anterior - j) * (media_y - y_anterior))
+            if area > maior_area:
+                melhor, maior_area = j, area
+        escolhidos.append(melhor)
+        anterior = melhor
+    escolhidos.append(total - 1)
+    return escolhidos
@@ -1,34 +1,137 @@
+import time
+# Referência dos tempos de arranque (/api/prontidao)
+INICIO_ARRANQUE = time.perf_counter()
+
 import os
 from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
-import paho.mqtt.client as mqtt
+from flask_socketio import SocketIO
 import json
 from datetime import datetime
 import threading
-from firebase_admin import db
+import atexit
+import platform
+import uuid
+import zlib
+from werkzeug.http import is_resource_modified
 
-from firebase import guardar_dados_em_firebase
+from firebase import (
+    caminho_agregado,
+    caminho_historico,
+    disputar_lease_lider,
+    gerar_chave_historico,
+    guardar_lote_em_firebase,
+    iniciar_firebase,
+    libertar_lease_lider,
+    serie_agregados,
+    serie_historico,
+)
+from armazenamento import HistoricoFirebase, criar_historico
+from fila_escrita import FilaEscrita
+from diario_escrita import DiarioEscrita
+from coalescencia import Coalescedor
+from topicos import CAMPOS, TOPICOS, TOPICOS_LOCAIS, interpretar, separar_local
+from difusao import EVENTO_SNAPSHOT, Difusor
+from cache_historico import BufferHistorico
+from paginacao import codificar_cursor, descodificar_cursor, limite_de_parametro
+from agregados import FORMATO_CHAVE, RESOLUCOES, Agregador, juntar_partes, juntar_resumos
+from amostragem import lttb_indices
+from barramento import CANAL_COMANDOS, CANAL_SNAPSHOTS, BarramentoLocal, criar_barramento
+from lideranca import Eleicao, LiderancaFicheiro, LiderancaLease
+from metricas_mqtt import MetricasMqtt
+from locais import Local, RegistoLocais, local_valido, sala_local
+from compressao import CompressorHttp, ContadorCompressao, configurar_deflate_websocket
+from hidratacao import GravadorEstado, estado_de_registos, ler_ficheiro_estado
+from arranque import DESATIVADO, ERRO, PENDENTE, PRONTO, Arranque
 
 # --- Configuração da Aplicação Flask ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'uma_chave_secreta_muito_segura_e_longa_para_o_aviario_2025'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Serialização do canal Socket.IO: "json" (texto) ou "msgpack" (frames binários,
+# mais pequenos; o dashboard carrega então o cliente Socket.IO com o parser msgpack)
+SOCKETIO_SERIALIZADOR = os.getenv("SOCKETIO_SERIALIZADOR", "json")
+if SOCKETIO_SERIALIZADOR not in ("json", "msgpack"):
+    raise ValueError(f"Serializador Socket.IO desconhecido: {SOCKETIO_SERIALIZADOR}")
+# --- Compressão ---
+# HTTP: respostas JSON (ex.: /api/historico) e o long-polling do Engine.IO com
+# pelo menos COMPRESSAO_HTTP_MIN_BYTES são comprimidas (br se disponível, gzip).
+# WebSocket: permessage-deflate (servidor eventlet) só para frames com pelo
+# menos WEBSOCKET_DEFLATE_MIN_BYTES; os pequenos não compensam o custo.
+COMPRESSAO_HTTP = os.getenv("COMPRESSAO_HTTP", "1") == "1"
+COMPRESSAO_HTTP_MIN_BYTES = int(os.getenv("COMPRESSAO_HTTP_MIN_BYTES", "1024"))
+WEBSOCKET_DEFLATE = os.getenv("WEBSOCKET_DEFLATE", "1") == "1"
+WEBSOCKET_DEFLATE_MIN_BYTES = int(os.getenv("WEBSOCKET_DEFLATE_MIN_BYTES", "256"))
+
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    # O python-socketio chama "default" ao serializador JSON
+    serializer="default" if SOCKETIO_SERIALIZADOR == "json" else SOCKETIO_SERIALIZADOR,
+    http_compression=COMPRESSAO_HTTP,
+    compression_threshold=COMPRESSAO_HTTP_MIN_BYTES,
+)
+
+compressor_http = CompressorHttp(min_bytes=COMPRESSAO_HTTP_MIN_BYTES)
+contador_deflate = ContadorCompressao()
+deflate_configurado = configurar_deflate_websocket(
+    socketio, ativo=WEBSOCKET_DEFLATE, min_bytes=WEBSOCKET_DEFLATE_MIN_BYTES, contador=contador_deflate)
+
+@app.after_request
+def comprimir_resposta(resposta):
+    if COMPRESSAO_HTTP:
+        resposta = compressor_http.comprimir(resposta, request.headers.get("Accept-Encoding"))
+    return resposta
+
+arranque = Arranque(INICIO_ARRANQUE)
+
+@app.after_request
+def registar_pedido(resposta):
+    arranque.registar_pedido()
+    return resposta
+
+# --- Papel do Processo e Barramento ---
+# "completo": ingestão MQTT + dashboard no mesmo processo (um único worker).
+# "ingestao": só MQTT e persistência; publica os snapshots no barramento.
+# "web": só dashboard; recebe os snapshots do barramento e difunde-os aos seus
+#        clientes, pelo que se podem correr vários workers/instâncias.
+# Com vários processos o barramento tem de ser partilhado (ex.: redis://...).
+AVIARIO_PAPEL = os.getenv("AVIARIO_PAPEL", "completo")
+INGESTAO_ATIVA = AVIARIO_PAPEL in ("completo", "ingestao")
+WEB_ATIVA = AVIARIO_PAPEL in ("completo", "web")
+BARRAMENTO_URL = os.getenv("BARRAMENTO_URL", "memoria://")
+# Só WebSocket (sem long-polling) no papel "web": com vários workers/instâncias
+# os pedidos de polling de uma sessão podem chegar a outro processo. O App
+# Engine standard não suporta WebSockets, por isso aí o papel "web" precisa do
+# ambiente flexible (com afinidade de sessão) e o polling fica ativo por omissão.
+SOCKETIO_APENAS_WEBSOCKET = os.getenv(
+    "SOCKETIO_APENAS_WEBSOCKET",
+    "1" if AVIARIO_PAPEL == "web" and os.getenv("GAE_ENV") != "standard" else "0") == "1"
+if AVIARIO_PAPEL == "web" and os.getenv("GAE_ENV") == "standard":
+    print("⚠️ Papel 'web' no App Engine standard: sem WebSockets, use o ambiente flexible.")
+
+# O estado da subscrição do barramento conta para /api/prontidao: um worker web
+# sem barramento não recebe snapshots
+def estado_barramento(ligado, erro=None):
+    arranque.marcar("barramento", PRONTO if ligado else (ERRO if erro else PENDENTE), erro)
+
+barramento = criar_barramento(BARRAMENTO_URL, ao_mudar_estado=estado_barramento)
 
 # --- Configuração MQTT ---
-BROKER = "test.mosquitto.org"
-PORT = 1883
-TOPICOS_SUB = [
-    "aviario/temperatura",
-    "aviario/humidade",
-    "aviario/luminosidade",
-    "aviario/gas",
-    "aviario/ventoinha",
-    "aviario/janela",
-]
-TOPICO_VENTOINHA_SET = "aviario/atuadores/ventoinha/set"
-TOPICO_JANELA_SET = "aviario/atuadores/janela/set"
-
-current_state = {
+BROKER = os.getenv("MQTT_BROKER_HOST", "test.mosquitto.org")
+PORT = int(os.getenv("MQTT_BROKER_PORT", "1883"))
+# Definidos no registo de tópicos (topicos.py): os originais (aviário por
+# omissão) e os de todos os aviários com wildcard (aviario/+/<sensor>)
+TOPICOS_SUB = list(TOPICOS) + TOPICOS_LOCAIS
+# Subscrições partilhadas MQTT v5 ($share/<grupo>/<tópico>): o broker reparte as
+# mensagens por um conjunto de processos de ingestão, cada um recebendo uma fatia
+# disjunta. Usar com LIDERANCA_MODO=nenhuma (todos os membros do grupo ingerem).
+MQTT_GRUPO_PARTILHADO = os.getenv("MQTT_GRUPO_PARTILHADO", "")
+# Espera entre tentativas de ligação ao broker (exponencial, entre min e max)
+MQTT_ESPERA_MIN_S = float(os.getenv("MQTT_ESPERA_MIN_S", "1"))
+MQTT_ESPERA_MAX_S = float(os.getenv("MQTT_ESPERA_MAX_S", "60"))
+ATUADORES = ("ventoinha", "janela")
+
+# Estado inicial de cada aviário
+ESTADO_INICIAL = {
     "temperatura": None,
     "humidade": None,
     "luminosidade": None,
@@ -38,108 +141,768 @@ current_state = {
     "timestamp": None,
 }
 
+# --- Vários Aviários ---
+# Cada aviário (local) tem o seu estado, sala Socket.IO e caminhos no Firebase.
+# O aviário por omissão recebe os tópicos originais (aviario/<sensor>) e mantém
+# os caminhos originais (aviario/historico, aviario/agregados).
+LOCAL_PREDEFINIDO = os.getenv("AVIARIO_LOCAL_PREDEFINIDO", "principal")
+LOCAIS_MAX = int(os.getenv("AVIARIO_LOCAIS_MAX", "100"))
+LOCAIS_PERMITIDOS = [l for l in os.getenv("AVIARIO_LOCAIS", "").split(",") if l]  # Vazio = todos
+
+def local_firebase(identificador):
+    # Identificador usado nos caminhos do Firebase (None = caminhos originais)
+    return None if identificador == LOCAL_PREDEFINIDO else identificador
+
+def topico_atuador(identificador, atuador):
+    if identificador == LOCAL_PREDEFINIDO:
+        return f"aviario/atuadores/{atuador}/set"
+    return f"aviario/{identificador}/atuadores/{atuador}/set"
+
+# --- Difusão para o Dashboard ---
+# Snapshot completo (com número de sequência) na ligação, deltas a seguir.
+# Cada cliente recebe no máximo DIFUSAO_MAX_HZ deltas por segundo (0 = sem limite);
+# os campos prioritários (alarmes) são enviados de imediato.
+DIFUSAO_MAX_HZ = float(os.getenv("DIFUSAO_MAX_HZ", "2"))
+DIFUSAO_CAMPOS_PRIORITARIOS = [c for c in os.getenv("DIFUSAO_CAMPOS_PRIORITARIOS", "gas").split(",") if c]
+DIFUSAO_MAX_PENDENTES = int(os.getenv("DIFUSAO_MAX_PENDENTES", "8"))
+
+# --- Fila de Escrita no Firebase ---
+# A persistência corre numa thread própria para não bloquear a thread de rede do MQTT.
+# Os registos são agrupados e enviados num único update() multi-caminho por lote.
+FIREBASE_FILA_MAX = int(os.getenv("FIREBASE_FILA_MAX", "1000"))
+FIREBASE_FILA_POLITICA = os.getenv("FIREBASE_FILA_POLITICA", "descartar")  # "descartar" ou "bloquear"
+FIREBASE_LOTE_MAX = int(os.getenv("FIREBASE_LOTE_MAX", "50"))
+FIREBASE_LOTE_MS = int(os.getenv("FIREBASE_LOTE_MS", "1000"))
+# Tempo máximo, ao terminar o processo, à espera de que a fila seja escrita
+FIREBASE_DRENAR_S = float(os.getenv("FIREBASE_DRENAR_S", "5"))
+
+# --- Backend do Histórico ---
+# "firebase": o histórico é lido do Firebase e escrito pela fila de escrita.
+# "sqlite": uma base SQLite local (modo WAL, indexada por série e chave) recebe
+# cada registo de imediato e serve as leituras; o Firebase passa a réplica
+# assíncrona (fila e diário) e só é lido para o que é anterior aos dados locais.
+# Os workers web leem o mesmo ficheiro, pelo que têm de estar na instância da ingestão.
+# "ficheiro": linhas JSON num ficheiro local, carregadas em memória ao arrancar.
+# "memoria": só em memória (testes e benchmarks).
+# Com um backend local e HISTORICO_REPLICA=nenhuma o processo não usa o
+# Firebase para o histórico (não precisa de credenciais nem de rede).
+HISTORICO_BACKEND = os.getenv("HISTORICO_BACKEND", "firebase")  # "firebase", "sqlite", "ficheiro" ou "memoria"
+HISTORICO_SQLITE = os.getenv("HISTORICO_SQLITE", "/tmp/aviario-historico.db")
+HISTORICO_FICHEIRO = os.getenv("HISTORICO_FICHEIRO", "/tmp/aviario-historico.jsonl")
+HISTORICO_REPLICA = os.getenv("HISTORICO_REPLICA", "firebase")  # "firebase" ou "nenhuma"
+if HISTORICO_REPLICA not in ("firebase", "nenhuma"):
+    raise ValueError(f"Réplica do histórico desconhecida: {HISTORICO_REPLICA}")
+
+# A fila de escrita (e o diário) escrevem no Firebase, seja ele o backend ou a réplica
+replica_firebase = None
+if HISTORICO_BACKEND == "firebase" or HISTORICO_REPLICA == "firebase":
+    replica_firebase = HistoricoFirebase()
+if HISTORICO_BACKEND == "firebase":
+    historico = replica_firebase
+else:
+    historico = criar_historico(
+        HISTORICO_BACKEND,
+        caminho=HISTORICO_SQLITE if HISTORICO_BACKEND == "sqlite" else HISTORICO_FICHEIRO,
+        remoto=replica_firebase,
+    )
+print(f"🗄️ Backend do histórico: {HISTORICO_BACKEND} (réplica: {HISTORICO_REPLICA if historico is not replica_firebase else '-'})")
+
+# --- Diário de Escrita (WAL) ---
+# Com DIARIO_DIRETORIO definido (ex.: /tmp/aviario-diario), cada registo é
+# acrescentado a um diário local antes de entrar na fila e confirmado depois de
+# o lote ser escrito no Firebase; o que ficar por confirmar (falha do Firebase,
+# fila cheia, reinício) é reenviado. Um diretório por processo de ingestão.
+DIARIO_DIRETORIO = os.getenv("DIARIO_DIRETORIO", "")  # Vazio = desativado
+DIARIO_SEGMENTO_BYTES = int(os.getenv("DIARIO_SEGMENTO_BYTES", str(4 * 1024 * 1024)))
+DIARIO_FSYNC = os.getenv("DIARIO_FSYNC", "intervalo")  # "sempre", "intervalo" ou "nunca"
+DIARIO_FSYNC_MS = int(os.getenv("DIARIO_FSYNC_MS", "1000"))
+DIARIO_REENVIO_S = float(os.getenv("DIARIO_REENVIO_S", "10"))
+
+diario = None
+if DIARIO_DIRETORIO and replica_firebase is not None:
+    diario = DiarioEscrita(
+        guardar_lote_em_firebase,
+        DIARIO_DIRETORIO,
+        tamanho_segmento=DIARIO_SEGMENTO_BYTES,
+        fsync=DIARIO_FSYNC,
+        intervalo_fsync=DIARIO_FSYNC_MS / 1000,
+        tamanho_lote=FIREBASE_LOTE_MAX,
+        intervalo_reenvio=DIARIO_REENVIO_S,
+    )
+    atexit.register(diario.fechar)
+
+fila_firebase = FilaEscrita(
+    diario.escrever_lote if diario is not None else guardar_lote_em_firebase,
+    max_profundidade=FIREBASE_FILA_MAX,
+    politica=FIREBASE_FILA_POLITICA,
+    tamanho_lote=FIREBASE_LOTE_MAX,
+    intervalo_lote=FIREBASE_LOTE_MS / 1000,
+)
+if INGESTAO_ATIVA and replica_firebase is not None:
+    fila_firebase.iniciar()
+
+# Devolve False se o registo se perdeu para o Firebase (fila cheia e sem diário)
+def persistir(caminho, dados):
+    if historico is not replica_firebase:
+        try:
+            historico.escrever_lote([(caminho, dados)])
+        except Exception as e:
+            print(f"❌ Erro ao escrever {caminho} no histórico local: {e}")
+        if replica_firebase is None:
+            return True
+    if diario is not None:
+        return diario.registar((caminho, dados), fila_firebase.enfileirar)
+    return fila_firebase.enfileirar((caminho, dados))
+
+# --- Cache do Histórico ---
+# Buffer circular (por aviário) com os registos mais recentes: alimentado pela
+# ingestão e aquecido a partir do backend do histórico, serve o /api/historico da memória.
+HISTORICO_LIMITE = 15
+HISTORICO_LIMITE_MAX = int(os.getenv("HISTORICO_LIMITE_MAX", "1000"))
+HISTORICO_CACHE_MAX = int(os.getenv("HISTORICO_CACHE_MAX", "2000"))
+# Tempo (s) durante o qual o browser reutiliza uma resposta do histórico sem a
+# revalidar; depois revalida com If-None-Match (resposta 304 se nada mudou)
+HISTORICO_CACHE_CONTROL_S = int(os.getenv("HISTORICO_CACHE_CONTROL_S", "5"))
+
+def aquecer_cache_historico(local):
+    try:
+        registos = historico.ler_ultimos(serie_historico(local_firebase(local.identificador)), HISTORICO_CACHE_MAX)
+        local.cache.carregar(registos, completo=len(registos) < HISTORICO_CACHE_MAX)
+        print(f"🔥 Cache do histórico de '{local.identificador}' aquecido com {len(local.cache)} registos.")
+    except Exception as e:
+        print(f"❌ Erro ao aquecer cache do histórico de '{local.identificador}': {e}")
+
+# --- Agregados (1 min / 15 min / 1 h) ---
+# Min/max/média/contagem por campo e intervalo, persistidos em .../agregados/<resolução>.
+# Cada processo escreve a sua parte de cada intervalo (chave "<início>_<parte>")
+# e a leitura junta as partes: com subscrições partilhadas cada worker só vê uma
+# fatia das mensagens, e um reinício ou failover não apaga a parte anterior.
+PARTE_AGREGADOS = uuid.uuid4().hex[:8]
+
+def ler_agregados(serie, inicio, fim, n):
+    # Últimos `n` intervalos já com as partes juntas. O intervalo mais antigo
+    # lido pode estar incompleto (partes cortadas pelo limite), por isso só
+    # conta se a leitura chegou ao início da série; senão lê-se mais
+    pedidos = n
+    while True:
+        partes = historico.ler_intervalo(serie, inicio, fim, pedidos)
+        intervalos = juntar_partes(partes)
+        if len(partes) < pedidos:
+            return intervalos[-n:]
+        if len(intervalos) > n:
+            return intervalos[-n:]
+        pedidos *= 2
+
+def persistir_agregado(identificador, resolucao, chave, resumo):
+    caminho = caminho_agregado(resolucao, chave, local_firebase(identificador))
+    if not persistir(caminho, resumo):
+        print(f"⚠️ Fila do Firebase cheia: agregado {identificador}/{resolucao}/{chave} descartado.")
+
+# --- Publicação de Snapshots ---
+# Enfileira o estado atual do aviário para o Firebase e publica-o no
+# barramento, de onde os workers web o difundem para a sala do aviário.
+def publicar_snapshot(local):
+    agora = datetime.now()
+    estado = local.estado
+    estado["timestamp"] = agora.strftime("%H:%M:%S")
+    campos = local.fechar_ciclo()
+    if MQTT_GRUPO_PARTILHADO:
+        # Só os campos que este worker recebeu neste ciclo: os restantes chegam
+        # a outros membros do grupo e não devem ser sobrepostos com valores por
+        # omissão nem com valores antigos recebidos por este worker
+        snapshot = {campo: estado[campo] for campo in campos}
+        snapshot["timestamp"] = estado["timestamp"]
+    else:
+        snapshot = dict(estado)
+    chave = gerar_chave_historico(agora)
+
+    local.agregador.adicionar(agora, snapshot)
+    if not persistir(caminho_historico(chave, local_firebase(local.identificador)), snapshot):
+        print("⚠️ Fila do Firebase cheia: registo descartado.")
+    barramento.publicar(CANAL_SNAPSHOTS, {"local": local.identificador, "chave": chave, "dados": snapshot})
+    print(f"📦 Conteúdo emitido ({local.identificador}): {snapshot}")
+    if gravador_estado is not None:
+        gravar_estado_local()
+
+def receber_snapshot(mensagem):
+    local = locais.obter(mensagem.get("local", LOCAL_PREDEFINIDO))
+    if local is None:
+        return
+    local.difusor.publicar(mensagem["dados"])
+    local.cache.adicionar(mensagem["chave"], mensagem["dados"])
+
+# Comandos dos atuadores vindos dos workers web
+def executar_comando(mensagem):
+    if eleicao is not None and not eleicao.lider:
+        return  # Só o líder tem a ligação MQTT ativa
+    if mqtt_client is None:
+        return  # A ingestão ainda não arrancou
+    mqtt_client.publish(mensagem["topico"], mensagem["payload"])
+
+# --- Coalescência da Ingestão ---
+# Um ciclo de publicação do ESP32 toca em vários tópicos; agrupá-los evita
+# snapshots (e linhas de histórico) quase idênticos por cada tópico.
+COALESCENCIA_MODO = os.getenv("COALESCENCIA_MODO", "janela")  # "imediato", "janela" ou "todos"
+COALESCENCIA_JANELA_MS = int(os.getenv("COALESCENCIA_JANELA_MS", "250"))
+
+# --- Hidratação do Estado no Arranque ---
+# Antes de a ingestão arrancar, o estado de cada aviário é reposto a partir do
+# último estado persistido: o dashboard mostra todos os valores e os primeiros
+# registos do histórico não saem com campos vazios.
+# "firebase": últimos HIDRATACAO_REGISTOS registos do histórico de cada aviário (lidos do backend do histórico).
+# "ficheiro": ESTADO_FICHEIRO, que a ingestão grava a cada ESTADO_FICHEIRO_INTERVALO_S.
+# "nenhuma": estado inicial vazio.
+HIDRATACAO_FONTE = os.getenv("HIDRATACAO_FONTE", "firebase")
+HIDRATACAO_REGISTOS = int(os.getenv("HIDRATACAO_REGISTOS", "20"))
+ESTADO_FICHEIRO = os.getenv("ESTADO_FICHEIRO", "")  # Vazio = não grava (ex.: /tmp/aviario-estado.json)
+ESTADO_FICHEIRO_INTERVALO_S = float(os.getenv("ESTADO_FICHEIRO_INTERVALO_S", "5"))
+if HIDRATACAO_FONTE not in ("firebase", "ficheiro", "nenhuma"):
+    raise ValueError(f"Fonte de hidratação desconhecida: {HIDRATACAO_FONTE}")
+if HIDRATACAO_FONTE == "ficheiro" and not ESTADO_FICHEIRO:
+    raise ValueError("HIDRATACAO_FONTE=ficheiro requer ESTADO_FICHEIRO")
+
+metricas_arranque = {}
+
+def hidratar_estados():
+    inicio = time.perf_counter()
+    estados, erro = {}, None
+    try:
+        if HIDRATACAO_FONTE == "ficheiro":
+            estados = ler_ficheiro_estado(ESTADO_FICHEIRO)
+        elif HIDRATACAO_FONTE == "firebase":
+            identificadores = [LOCAL_PREDEFINIDO] + [l for l in historico.listar_locais() if l != LOCAL_PREDEFINIDO]
+            for identificador in identificadores[:LOCAIS_MAX]:
+                registos = historico.ler_ultimos(serie_historico(local_firebase(identificador)), HIDRATACAO_REGISTOS)
+                estado = estado_de_registos(registos, ESTADO_INICIAL)
+                if estado:
+                    estados[identificador] = estado
+    except Exception as e:
+        # Sem estado persistido o arranque continua com o estado vazio
+        erro = str(e)
+        print(f"❌ Erro ao hidratar o estado ({HIDRATACAO_FONTE}): {e}")
+    duracao = time.perf_counter() - inicio
+    metricas_arranque["hidratacao"] = {
+        "fonte": HIDRATACAO_FONTE,
+        "locais": len(estados),
+        "tempo_ms": round(duracao * 1000, 1),
+        "erro": erro,
+    }
+    print(f"💧 Estado hidratado ({HIDRATACAO_FONTE}): {len(estados)} aviário(s) em {duracao * 1000:.0f} ms.")
+    return estados
+
+estados_hidratados = {}
+
+def aplicar_estados_hidratados(estados):
+    for identificador, estado in estados.items():
+        estados_hidratados[identificador] = estado
+        local = locais.obter(identificador, criar=False)
+        if local is None:
+            locais.obter(identificador)  # criar_local junta o estado hidratado
+            continue
+        # Aviário criado antes da hidratação (ex.: o predefinido): só os campos
+        # que ainda não chegaram por MQTT ou pelo barramento
+        valores = {campo: valor for campo, valor in estado.items()
+                   if campo in ESTADO_INICIAL and campo not in local.campos_recebidos}
+        local.estado.update(valores)
+        local.difusor.preencher(valores)
+
+gravador_estado = GravadorEstado(ESTADO_FICHEIRO, ESTADO_FICHEIRO_INTERVALO_S) \
+    if ESTADO_FICHEIRO and INGESTAO_ATIVA else None
+
+def gravar_estado_local(forcar=False):
+    try:
+        gravador_estado.gravar(lambda: {local.identificador: dict(local.estado) for local in locais}, forcar)
+    except Exception as e:
+        print(f"❌ Erro ao gravar o estado em {ESTADO_FICHEIRO}: {e}")
+
+if gravador_estado is not None:
+    atexit.register(gravar_estado_local, True)
+
+# --- Registo de Aviários ---
+def criar_local(identificador):
+    estado = dict(ESTADO_INICIAL)
+    estado.update((campo, valor) for campo, valor in estados_hidratados.get(identificador, {}).items()
+                  if campo in ESTADO_INICIAL)
+    local = Local(identificador, estado)
+    local.difusor = Difusor(
+        socketio,
+        local.estado,
+        max_hz=DIFUSAO_MAX_HZ,
+        campos_prioritarios=DIFUSAO_CAMPOS_PRIORITARIOS,
+        max_pendentes=DIFUSAO_MAX_PENDENTES,
+        sala=sala_local(identificador),
+    )
+    local.cache = BufferHistorico(CAMPOS, capacidade=HISTORICO_CACHE_MAX)
+    local.agregador = Agregador(
+        CAMPOS, lambda resolucao, chave, resumo: persistir_agregado(identificador, resolucao, chave, resumo),
+        parte=PARTE_AGREGADOS)
+    local.coalescedor = Coalescedor(
+        lambda: publicar_snapshot(local),
+        modo=COALESCENCIA_MODO,
+        janela=COALESCENCIA_JANELA_MS / 1000,
+        topicos_esperados=TOPICOS,
+    )
+    if WEB_ATIVA:
+        cache_thread = threading.Thread(target=aquecer_cache_historico, args=(local,))
+        cache_thread.daemon = True
+        cache_thread.start()
+    print(f"🏠 Aviário registado: {identificador}")
+    return local
+
+locais = RegistoLocais(criar_local, maximo=LOCAIS_MAX, permitidos=LOCAIS_PERMITIDOS)
+locais.obter(LOCAL_PREDEFINIDO)
+
 # --- Callbacks MQTT ---
-def on_connect(client, userdata, flags, rc):
+metricas_mqtt = MetricasMqtt()
+
+def filtro_subscricao(topico):
+    return f"$share/{MQTT_GRUPO_PARTILHADO}/{topico}" if MQTT_GRUPO_PARTILHADO else topico
+
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print("✅ Conectado ao broker MQTT.")
-        for topico in TOPICOS_SUB:
-            client.subscribe(topico)
-            print(f"📡 Subscrito: {topico}")
+        arranque.marcar("mqtt", PRONTO)
+        filtros = [filtro_subscricao(topico) for topico in TOPICOS_SUB]
+        client.subscribe([(filtro, 0) for filtro in filtros])
+        for filtro in filtros:
+            print(f"📡 Subscrito: {filtro}")
     else:
+        arranque.marcar("mqtt", ERRO, f"ligação recusada (código {rc})")
         print(f"❌ Falha na conexão MQTT com código: {rc}")
 
+def on_disconnect(client, userdata, rc, properties=None):
+    # Uma desconexão pedida (rc 0) é tratada em parar_ingestao; nas restantes
+    # o loop_forever volta a ligar sozinho
+    if rc != 0:
+        arranque.marcar("mqtt", PENDENTE, f"desligado (código {rc})")
+
 def on_message(client, userdata, msg):
-    payload_str = msg.payload.decode('utf-8')
+    payload_str = msg.payload.decode('utf-8', errors='replace')
     print(f"📥 MQTT Recebido: Tópico='{msg.topic}', Payload='{payload_str}'")
 
     try:
-        if msg.topic == "aviario/temperatura":
-            current_state["temperatura"] = float(payload_str)
-        elif msg.topic == "aviario/humidade":
-            current_state["humidade"] = float(payload_str)
-        elif msg.topic == "aviario/luminosidade":
-            current_state["luminosidade"] = int(payload_str)
-        elif msg.topic == "aviario/gas":
-            current_state["gas"] = bool(int(payload_str))
-        elif msg.topic == "aviario/ventoinha":
-            current_state["ventoinha"] = bool(int(payload_str))
-        elif msg.topic == "aviario/janela":
-            current_state["janela"] = bool(int(payload_str.strip()))
-
-        current_state["timestamp"] = datetime.now().strftime("%H:%M:%S")
-
-
-        socketio.emit('new_sensor_data', current_state)
-        guardar_dados_em_firebase(current_state)
-        print(f"📦 Conteúdo emitido: {current_state}")
+        identificador, topico = separar_local(msg.topic)
+        campo, valor, erro = interpretar(topico, payload_str)
+        local = None
+        if erro is None:
+            local = locais.obter(identificador or LOCAL_PREDEFINIDO)
+            if local is None:
+                erro = "aviário inválido ou limite de aviários atingido"
+        # Por tópico sem o aviário: os identificadores vêm de quem publica
+        metricas_mqtt.registar(topico, aceite=erro is None)
+        if erro is not None:
+            print(f"❌ Payload rejeitado ({erro}): '{payload_str}' (Tópico: {msg.topic})")
+            return
+
+        local.estado[campo] = valor
+        local.registar_campo(campo)
+        local.coalescedor.registar(topico)
 
-    except ValueError as e:
-        print(f"❌ Erro de conversão de payload: {e} - Payload: '{payload_str}' (Tópico: {msg.topic})")
     except Exception as e:
         print(f"❌ Erro ao processar mensagem MQTT na callback: {e}")
 
 # --- Inicialização do Cliente MQTT ---
-mqtt_client = mqtt.Client(client_id=f"flask-app-{os.getenv('GAE_INSTANCE', 'dev')}-{os.getpid()}")
-mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
+# Criado quando a ingestão arranca: o paho-mqtt (que importa o dnspython) é a
+# importação mais lenta da aplicação e os processos só web não o usam
+mqtt_client = None
+
+def criar_cliente_mqtt():
+    import paho.mqtt.client as mqtt
+    cliente = mqtt.Client(
+        client_id=f"flask-app-{os.getenv('GAE_INSTANCE', 'dev')}-{os.getpid()}",
+        # As subscrições partilhadas só existem a partir do MQTT v5
+        protocol=mqtt.MQTTv5 if MQTT_GRUPO_PARTILHADO else mqtt.MQTTv311,
+    )
+    cliente.on_connect = on_connect
+    cliente.on_disconnect = on_disconnect
+    cliente.on_message = on_message
+    return cliente
 
-def start_mqtt_client():
+def start_mqtt_client(parar):
+    # A primeira ligação é repetida com espera exponencial (erro de DNS, broker
+    # em baixo); depois de ligado o loop_forever volta a ligar sozinho. `parar`
+    # interrompe as tentativas quando a ingestão é parada (liderança perdida)
+    espera = MQTT_ESPERA_MIN_S
+    while not parar.is_set():
+        try:
+            mqtt_client.connect(BROKER, PORT, 60)
+            arranque.marcar("mqtt", PENDENTE)  # Pronto quando o broker aceitar (on_connect)
+            break
+        except Exception as e:
+            arranque.marcar("mqtt", ERRO, str(e))
+            print(f"❌ Erro ao ligar ao broker MQTT ({e}); nova tentativa dentro de {espera:.1f} s.")
+            parar.wait(espera)
+            espera = min(espera * 2, MQTT_ESPERA_MAX_S)
+    if parar.is_set():
+        return
     try:
-        mqtt_client.connect(BROKER, PORT, 60)
         mqtt_client.loop_forever()
     except Exception as e:
-        print(f"❌ Erro fatal ao iniciar loop MQTT: {e}")
+        arranque.marcar("mqtt", ERRO, str(e))
+        print(f"❌ Erro fatal no loop MQTT: {e}")
+
+if WEB_ATIVA:
+    barramento.subscrever(CANAL_SNAPSHOTS, receber_snapshot)
+if INGESTAO_ATIVA:
+    barramento.subscrever(CANAL_COMANDOS, executar_comando)
+barramento.iniciar()
+
+def iniciar_ingestao():
+    global mqtt_thread, mqtt_client, mqtt_parar
+    if mqtt_client is None:
+        mqtt_client = criar_cliente_mqtt()
+    if diario is not None:
+        # Reenvia o que ficou por confirmar de uma execução anterior
+        diario.abrir()
+    arranque.marcar("mqtt", PENDENTE)
+    mqtt_parar = threading.Event()
+    mqtt_thread = threading.Thread(target=start_mqtt_client, args=(mqtt_parar,))
+    mqtt_thread.daemon = True
+    mqtt_thread.start()
+    print("🚀 Thread MQTT iniciada.")
 
-mqtt_thread = threading.Thread(target=start_mqtt_client)
-mqtt_thread.daemon = True
-mqtt_thread.start()
-print("🚀 Thread MQTT iniciada.")
+def descarregar_agregados():
+    # Os intervalos em curso só são persistidos quando fecham: sem isto um
+    # reinício ou failover perdia até uma hora de amostras
+    for local in locais:
+        local.agregador.descarregar()
+
+def terminar_ingestao():
+    descarregar_agregados()
+    if replica_firebase is not None and not fila_firebase.drenar(FIREBASE_DRENAR_S):
+        print("⚠️ Fila do Firebase não ficou vazia antes de terminar.")
+
+def parar_ingestao():
+    if mqtt_parar is not None:
+        mqtt_parar.set()
+    if mqtt_client is not None:
+        mqtt_client.disconnect()
+    descarregar_agregados()
+    if diario is not None:
+        # Liberta o diretório: os registos por confirmar ficam para o próximo líder
+        diario.fechar()
+    arranque.marcar("mqtt", DESATIVADO)
+    print("🛑 Ingestão MQTT parada (liderança perdida).")
+
+if INGESTAO_ATIVA:
+    # Registado depois de diario.fechar, por isso corre antes dele (atexit é LIFO)
+    atexit.register(terminar_ingestao)
+
+# --- Eleição do Processo de Ingestão ---
+# Com vários workers/instâncias, só o líder subscreve o MQTT e persiste; os
+# restantes servem apenas tráfego web e assumem se o líder desaparecer.
+# "ficheiro": lock local partilhado pelos workers da mesma instância.
+# "firebase": lease em aviario/lider partilhado por todas as instâncias.
+LIDERANCA_MODO = os.getenv("LIDERANCA_MODO", "nenhuma")  # "nenhuma", "ficheiro" ou "firebase"
+LIDERANCA_FICHEIRO = os.getenv("LIDERANCA_FICHEIRO", "/tmp/aviario-ingestao.lock")
+LIDERANCA_TTL_S = float(os.getenv("LIDERANCA_TTL_S", "15"))
+IDENTIFICADOR_PROCESSO = f"{os.getenv('GAE_INSTANCE', platform.node())}-{os.getpid()}"
+
+eleicao = None
+mqtt_thread = None
+mqtt_parar = None
+if INGESTAO_ATIVA and LIDERANCA_MODO != "nenhuma":
+    # Os seguidores recebem os snapshots e entregam os comandos ao líder pelo
+    # barramento: com o barramento em memória os seus clientes ficariam parados
+    if isinstance(barramento, BarramentoLocal):
+        raise ValueError(f"LIDERANCA_MODO={LIDERANCA_MODO} requer um BARRAMENTO_URL partilhado (ex.: redis://...)")
+    if LIDERANCA_MODO == "ficheiro":
+        estrategia = LiderancaFicheiro(LIDERANCA_FICHEIRO)
+    elif LIDERANCA_MODO == "firebase":
+        estrategia = LiderancaLease(disputar_lease_lider, libertar_lease_lider,
+                                    IDENTIFICADOR_PROCESSO, ttl=LIDERANCA_TTL_S)
+    else:
+        raise ValueError(f"Modo de liderança desconhecido: {LIDERANCA_MODO}")
+    eleicao = Eleicao(estrategia, iniciar_ingestao, parar_ingestao, intervalo=LIDERANCA_TTL_S / 3)
+    atexit.register(eleicao.libertar)
+print(f"🧭 Papel do processo: {AVIARIO_PAPEL} (liderança: {LIDERANCA_MODO})")
+
+# --- Arranque dos Subsistemas ---
+# Com ARRANQUE_DIFERIDO (por omissão) o Firebase, a hidratação e a ingestão
+# arrancam numa thread, por esta ordem, e o gunicorn serve pedidos logo após a
+# importação; /api/prontidao indica quando cada subsistema está pronto. Os
+# clientes que ligam antes da hidratação recebem o estado hidratado como delta.
+ARRANQUE_DIFERIDO = os.getenv("ARRANQUE_DIFERIDO", "1") == "1"
+
+def arrancar_subsistemas():
+    if replica_firebase is not None or LIDERANCA_MODO == "firebase":
+        arranque.executar("firebase", iniciar_firebase)
+    if HIDRATACAO_FONTE != "nenhuma":
+        arranque.marcar("hidratacao", PENDENTE)
+        estados = hidratar_estados()
+        aplicar_estados_hidratados(estados)
+        erro = metricas_arranque["hidratacao"]["erro"]
+        arranque.marcar("hidratacao", PRONTO if erro is None else ERRO, erro)
+    if INGESTAO_ATIVA:
+        if eleicao is None:
+            iniciar_ingestao()
+        else:
+            # Até ser eleito, este processo não tem ligação MQTT
+            arranque.marcar("mqtt", DESATIVADO)
+            eleicao.iniciar()
+
+if ARRANQUE_DIFERIDO:
+    arranque_thread = threading.Thread(target=arrancar_subsistemas, name="arranque")
+    arranque_thread.daemon = True
+    arranque_thread.start()
+else:
+    arrancar_subsistemas()
 
 # --- Rotas Flask ---
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # Com vários workers web as sessões de long-polling não sobrevivem a mudar de
+    # worker, por isso o cliente liga-se diretamente por WebSocket
+    identificador = request.args.get('local', LOCAL_PREDEFINIDO)
+    if not local_valido(identificador):
+        return jsonify({"erro": "local inválido"}), 400
+    return render_template('index.html', apenas_websocket=SOCKETIO_APENAS_WEBSOCKET, local=identificador,
+                           msgpack=SOCKETIO_SERIALIZADOR == "msgpack")
 
+# Parâmetros opcionais: local (aviário; por omissão LOCAL_PREDEFINIDO),
+# from/to (prefixo de chave ou data ISO), limit, cursor,
+# resolution ("raw" ou uma de RESOLUCOES, para os agregados min/max/média) e
+# points (reduz a página a N pontos com LTTB; sem limit usa HISTORICO_LIMITE_MAX).
+# Devolve os registos mais recentes do intervalo em ordem cronológica; se houver
+# registos mais antigos, o cabeçalho X-Cursor-Seguinte traz o cursor da página seguinte.
 @app.route('/api/historico')
 def get_historico():
     try:
-        ref = db.reference('aviario/historico')
-        all_data = ref.order_by_key().limit_to_last(15).get()
-        # Inverter para ordem cronológica (mais antigo primeiro)
-        if isinstance(all_data, dict):
-            lista_ordenada = sorted(all_data.items(), key=lambda x: x[0])
-            return jsonify([item[1] for item in lista_ordenada])
-        return jsonify([])
+        identificador = request.args.get('local', LOCAL_PREDEFINIDO)
+        if not local_valido(identificador):
+            raise ValueError("local inválido")
+        inicio = limite_de_parametro(request.args.get('from'))
+        fim = limite_de_parametro(request.args.get('to'), fim=True)
+        pontos = request.args.get('points')
+        pontos = int(pontos) if pontos is not None else None
+        if pontos is not None and pontos < 3:
+            raise ValueError("points deve ser pelo menos 3")
+        limite = int(request.args.get('limit', HISTORICO_LIMITE if pontos is None else HISTORICO_LIMITE_MAX))
+        cursor = descodificar_cursor(request.args.get('cursor'))
+        resolucao = request.args.get('resolution', 'raw')
+        if resolucao != 'raw' and resolucao not in RESOLUCOES:
+            raise ValueError(f"resolution deve ser 'raw' ou uma de {', '.join(RESOLUCOES)}")
+        if not 0 < limite <= HISTORICO_LIMITE_MAX:
+            raise ValueError(f"limit deve estar entre 1 e {HISTORICO_LIMITE_MAX}")
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    if cursor is not None:
+        fim = cursor if fim is None else min(fim, cursor)
+    # Um registo extra indica se há mais páginas (e outro para o próprio cursor, que é excluído)
+    pedidos = limite + 1 + (cursor is not None)
+    # Um aviário ainda sem dados neste processo é lido diretamente do backend do histórico
+    local = locais.obter(identificador, criar=False)
+
+    # GET condicional: a versão é a chave do registo mais recente do aviário
+    # (também serve os agregados, cujo intervalo em curso muda a cada registo),
+    # pelo que um pedido repetido sem dados novos é respondido com 304 sem
+    # consultar o cache nem o backend
+    versao = local.cache.ultima_chave() if local is not None else None
+    if versao is not None:
+        etag = f"{versao}-{zlib.crc32(request.query_string):08x}"
+        ultima_modificacao = datetime.strptime(versao[:15], FORMATO_CHAVE).astimezone()
+        if not is_resource_modified(request.environ, etag=etag, last_modified=ultima_modificacao):
+            return validadores_historico(app.response_class(status=304), etag, ultima_modificacao)
+
+    try:
+        if resolucao == 'raw':
+            registos = local.cache.intervalo(inicio, fim, pedidos) if local is not None else None
+            if registos is None:
+                # Cache frio ou intervalo anterior ao buffer: lê do backend
+                registos = historico.ler_intervalo(
+                    serie_historico(local_firebase(identificador)), inicio, fim, pedidos)
+        else:
+            registos = ler_agregados(
+                serie_agregados(resolucao, local_firebase(identificador)), inicio, fim, pedidos)
+            # Junta o intervalo ainda em curso, que só é persistido quando fecha
+            # (às partes já persistidas do mesmo intervalo, se existirem)
+            aberto = local.agregador.aberto(resolucao) if local is not None else None
+            if aberto is not None and (inicio is None or aberto[0] >= inicio) and (fim is None or aberto[0] <= fim):
+                if registos and registos[-1][0] == aberto[0]:
+                    registos[-1] = (aberto[0], juntar_resumos([registos[-1][1], aberto[1]]))
+                elif not registos or aberto[0] > registos[-1][0]:
+                    registos.append(aberto)
     except Exception as e:
-        print(f"❌ Erro ao ler histórico do Firebase: {e}")
+        print(f"❌ Erro ao ler o histórico: {e}")
         return jsonify([]), 500
 
+    if cursor is not None:
+        registos = [(chave, dados) for chave, dados in registos if chave < cursor]
+    pagina = registos[-limite:]
+    dados_pagina = [dados for _, dados in pagina]
+    if pontos is not None:
+        dados_pagina = amostrar_registos(dados_pagina, pontos, agregados=resolucao != 'raw')
+    resposta = jsonify(dados_pagina)
+    if len(registos) > limite:
+        resposta.headers['X-Cursor-Seguinte'] = codificar_cursor(pagina[0][0])
+    if versao is not None:
+        validadores_historico(resposta, etag, ultima_modificacao)
+    return resposta
+
+def validadores_historico(resposta, etag, ultima_modificacao):
+    # ETag fraco: a mesma versão é servida em identity, gzip ou br (o compressor
+    # corre depois), e um validador forte teria de ser diferente por codificação
+    resposta.set_etag(etag, weak=True)
+    resposta.last_modified = ultima_modificacao
+    resposta.cache_control.public = True
+    resposta.cache_control.max_age = HISTORICO_CACHE_CONTROL_S
+    return resposta
+
+# Campos numéricos usados na escolha dos pontos a manter (nos agregados, a média)
+CAMPOS_NUMERICOS = [campo for campo, tipo in CAMPOS.items() if tipo != "binario"]
+
+def amostrar_registos(registos, pontos, agregados=False):
+    def valor(registo, campo):
+        v = registo.get(campo)
+        if agregados and isinstance(v, dict):
+            v = v.get("media")
+        return float(v) if isinstance(v, (int, float)) else None
+
+    colunas = [[valor(registo, campo) for registo in registos] for campo in CAMPOS_NUMERICOS]
+    return [registos[i] for i in lttb_indices(colunas, pontos)]
+
+@app.route('/api/metricas')
+def get_metricas():
+    return jsonify({
+        "papel": AVIARIO_PAPEL,
+        "arranque": dict(metricas_arranque, **arranque.metricas()),
+        "serializador": SOCKETIO_SERIALIZADOR,
+        "compressao": {
+            "http": compressor_http.metricas() if COMPRESSAO_HTTP else None,
+            "websocket": dict(contador_deflate.metricas(), ativo=WEBSOCKET_DEFLATE,
+                              min_bytes=WEBSOCKET_DEFLATE_MIN_BYTES)
+            if deflate_configurado else None,
+        },
+        "lideranca": eleicao.metricas() if eleicao is not None else None,
+        "mqtt": dict(metricas_mqtt.metricas(), grupo_partilhado=MQTT_GRUPO_PARTILHADO or None),
+        "barramento": barramento.metricas(),
+        "historico": historico.metricas(),
+        "fila_firebase": fila_firebase.metricas(),
+        "diario": diario.metricas() if diario is not None else None,
+        "locais": dict(locais.metricas(), por_local={
+            local.identificador: {
+                "coalescencia": local.coalescedor.metricas(),
+                "difusao": local.difusor.metricas(),
+                "cache_historico": local.cache.metricas(),
+                "agregados": local.agregador.metricas(),
+            }
+            for local in locais
+        }),
+    })
+
+# Prontidão: 200 quando todos os subsistemas ativos deste processo estão
+# prontos, 503 enquanto algum estiver pendente ou em erro
+@app.route('/api/prontidao')
+def prontidao():
+    metricas = arranque.metricas()
+    return jsonify(metricas), 200 if metricas["pronto"] else 503
+
+# Pedido de aquecimento do App Engine (inbound_services: warmup): a importação
+# da aplicação já arrancou os subsistemas, pelo que responde de imediato
+@app.route('/_ah/warmup')
+def aquecimento():
+    return "", 200
+
 # --- Eventos SocketIO ---
+# Aviário de cada cliente ligado (sid -> Local); o cliente escolhe-o com o
+# parâmetro `local` da ligação e só recebe as atualizações da sala desse aviário.
+# O parâmetro `campos` (ex.: "gas") limita as atualizações a esses campos.
+local_do_cliente = {}
+
+def campos_de_parametro(valor):
+    # "temperatura,gas" ou lista -> frozenset; vazio/None = todos os campos
+    if not valor:
+        return None
+    campos = frozenset(valor.split(",") if isinstance(valor, str) else valor)
+    desconhecidos = campos.difference(CAMPOS)
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos: {', '.join(sorted(map(str, desconhecidos)))}")
+    return campos
+
 @socketio.on('connect')
 def handle_connect():
-    print(f"🔗 Cliente WebSocket conectado: {request.sid}")
-    emit('new_sensor_data', current_state)
-    print("📤 SocketIO Emitido (on_connect): new_sensor_data")
-    print(f"📦 Conteúdo emitido: {current_state}")
+    # Os aviários só são criados pela ingestão e pela hidratação: um browser
+    # não pode ocupar o registo (nem aquecer caches) com identificadores arbitrários
+    local = locais.obter(request.args.get('local', LOCAL_PREDEFINIDO), criar=False)
+    try:
+        campos = campos_de_parametro(request.args.get('campos'))
+    except ValueError as e:
+        print(f"⚠️ Ligação recusada ({e}): {request.sid}")
+        return False
+    if local is None:
+        print(f"⚠️ Ligação recusada (aviário desconhecido): {request.sid}")
+        return False
+    print(f"🔗 Cliente WebSocket conectado: {request.sid} ({local.identificador})")
+    local_do_cliente[request.sid] = local
+    # O difusor envia o snapshot já serializado (partilhado com os outros clientes)
+    snapshot = local.difusor.registar_cliente(request.sid, campos)
+    print(f"📤 SocketIO Emitido (on_connect): {EVENTO_SNAPSHOT}")
+    print(f"📦 Conteúdo emitido: {snapshot}")
+
+@socketio.on('pedir_resync')
+def handle_pedir_resync():
+    # O cliente detetou uma falha na sequência de deltas
+    local = local_do_cliente.get(request.sid)
+    if local is None:
+        return
+    print(f"🔄 Pedido de resync do cliente: {request.sid}")
+    local.difusor.reenviar_snapshot(request.sid)
+
+@socketio.on('subscrever')
+def handle_subscrever(data):
+    # Muda o aviário e/ou os campos subscritos sem voltar a ligar; responde com
+    # um novo snapshot (o ack devolve o erro, se houver)
+    anterior = local_do_cliente.get(request.sid)
+    if anterior is None:
+        return {"erro": "cliente não registado"}
+    data = data or {}
+    try:
+        campos = campos_de_parametro(data.get('campos'))
+    except ValueError as e:
+        return {"erro": str(e)}
+    local = locais.obter(data.get('local', anterior.identificador), criar=False)
+    if local is None:
+        return {"erro": "local desconhecido"}
+
+    if local is anterior:
+        local.difusor.subscrever(request.sid, campos)
+    else:
+        anterior.difusor.remover_cliente(request.sid)
+        local_do_cliente[request.sid] = local
+        local.difusor.registar_cliente(request.sid, campos)
+    print(f"📡 Cliente {request.sid} subscreveu {local.identificador}: {sorted(campos) if campos else 'todos'}")
+    return {"local": local.identificador, "campos": sorted(campos) if campos else None}
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    local = local_do_cliente.pop(request.sid, None)
+    if local is not None:
+        local.difusor.remover_cliente(request.sid)
     print(f"🔌 Cliente WebSocket desconectado: {request.sid}")
 
 @socketio.on('toggle_actuator')
 def handle_toggle_actuator(data):
+    local = local_do_cliente.get(request.sid)
     actuator_type = data.get('type')
     new_state = int(data.get('state'))
 
-    print(f"⚡ Pedido de toggle para {actuator_type}: {new_state}")
+    if local is None:
+        return
+    print(f"⚡ Pedido de toggle para {actuator_type} ({local.identificador}): {new_state}")
 
-    if actuator_type == "ventoinha":
-        mqtt_client.publish(TOPICO_VENTOINHA_SET, str(new_state))
-    elif actuator_type == "janela":
-        mqtt_client.publish(TOPICO_JANELA_SET, str(new_state))
+    # O comando segue pelo barramento até ao processo que tem a ligação MQTT
+    if actuator_type in ATUADORES:
+        barramento.publicar(CANAL_COMANDOS, {
+            "topico": topico_atuador(local.identificador, actuator_type),
+            "payload": str(new_state),
+        })
     else:
         print(f"⚠️ Atuador desconhecido: {actuator_type}")
 
+arranque.importacao_concluida()
+print(f"⏱️ Aplicação importada em {arranque.importacao_ms:.0f} ms (prontidão em /api/prontidao).")
+
 # if __name__ == '__main__':
 #     print("⚠️ Executando localmente com socketio.run().")
 #     socketio.run(app, debug=True, host='127.0.0.1', port=5000, allow_unsafe_werkzeug=True)
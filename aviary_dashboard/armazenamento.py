@@ -0,0 +1,281 @@
+import bisect
+import json
+import threading
+import time
+
+from firebase import guardar_lote_em_firebase, ler_intervalo, listar_locais
+
+# --- Backends do Histórico ---
+# Todos os backends têm a mesma interface:
+#   escrever_lote(registos)               registos = [(caminho, dados)], caminho "<série>/<chave>"
+#   ler_intervalo(serie, inicio, fim, n)  últimos `n` (chave, dados) com chave em [inicio, fim], por ordem cronológica
+#   ler_ultimos(serie, n)
+#   listar_locais()                       aviários com série própria (sites/<local>/...)
+#   metricas()
+# O backend é escolhido por configuração (HISTORICO_BACKEND); os backends em
+# memória e em ficheiro não precisam de rede e servem testes e benchmarks
+# (ver benchmark_armazenamento.py).
+
+
+# Leituras e escritas diretamente no Firebase Realtime Database.
+class HistoricoFirebase:
+    tipo = "firebase"
+
+    def escrever_lote(self, registos):
+        guardar_lote_em_firebase(registos)
+
+    def ler_intervalo(self, serie, inicio, fim, n):
+        return ler_intervalo(serie, inicio, fim, n)
+
+    def ler_ultimos(self, serie, n):
+        return self.ler_intervalo(serie, None, None, n)
+
+    def listar_locais(self):
+        return listar_locais()
+
+    def metricas(self):
+        return {"tipo": self.tipo}
+
+
+# Base SQLite local em modo WAL (leitores não bloqueiam o escritor, e outros
+# processos da instância podem ler o mesmo ficheiro). Os registos ficam numa
+# tabela com chave primária (série, chave), pelo que um intervalo é uma procura
+# no índice seguida de uma leitura sequencial.
+#
+# Com `remoto`, o que é anterior ao primeiro registo local de uma série (dados
+# de antes de o backend local existir, ou de outra instância) é lido do remoto e
+# juntado ao resultado local.
+class HistoricoSQLite:
+    tipo = "sqlite"
+
+    def __init__(self, caminho, remoto=None):
+        import sqlite3
+        self.caminho = caminho
+        self._remoto = remoto
+        self._lock = threading.Lock()
+        self._ligacao = sqlite3.connect(caminho, check_same_thread=False)
+        with self._ligacao:
+            self._ligacao.execute("PRAGMA journal_mode=WAL")
+            # Em modo WAL, NORMAL só sincroniza nos checkpoints: um corte de
+            # energia pode perder as últimas transações, mas não corrompe a base
+            self._ligacao.execute("PRAGMA synchronous=NORMAL")
+            self._ligacao.execute(
+                "CREATE TABLE IF NOT EXISTS registos ("
+                "serie TEXT NOT NULL, chave TEXT NOT NULL, dados TEXT NOT NULL, "
+                "PRIMARY KEY (serie, chave)) WITHOUT ROWID")
+            self._ligacao.execute("CREATE TABLE IF NOT EXISTS series (serie TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._primeiras = {}  # serie -> primeira chave local
+        self._sem_anteriores = set()  # Séries sem registos remotos anteriores aos locais
+        self.escritos = 0
+        self.leituras = 0
+        self.leituras_remotas = 0
+        self.erros_remotos = 0
+        self.tempo_escrita = 0.0
+        self.tempo_leitura = 0.0
+
+    def escrever_lote(self, registos):
+        linhas = []
+        for caminho, dados in registos:
+            serie, _, chave = caminho.rpartition("/")
+            linhas.append((serie, chave, json.dumps(dados, separators=(",", ":"))))
+        if not linhas:
+            return
+        inicio = time.perf_counter()
+        with self._lock, self._ligacao:
+            self._ligacao.executemany("INSERT OR REPLACE INTO registos VALUES (?, ?, ?)", linhas)
+            self._ligacao.executemany("INSERT OR IGNORE INTO series VALUES (?)", {(linha[0],) for linha in linhas})
+            self.escritos += len(linhas)
+            self.tempo_escrita += time.perf_counter() - inicio
+
+    def _ler_local(self, serie, inicio, fim, n):
+        sql = "SELECT chave, dados FROM registos WHERE serie = ?"
+        parametros = [serie]
+        if inicio is not None:
+            sql += " AND chave >= ?"
+            parametros.append(inicio)
+        if fim is not None:
+            sql += " AND chave <= ?"
+            parametros.append(fim)
+        sql += " ORDER BY chave DESC LIMIT ?"
+        parametros.append(n)
+        inicio_leitura = time.perf_counter()
+        with self._lock:
+            linhas = self._ligacao.execute(sql, parametros).fetchall()
+            self.leituras += 1
+            self.tempo_leitura += time.perf_counter() - inicio_leitura
+        return [(chave, json.loads(dados)) for chave, dados in reversed(linhas)]
+
+    def _primeira_chave(self, serie):
+        # A primeira chave de uma série não muda depois de existir (as novas chaves são sempre maiores)
+        primeira = self._primeiras.get(serie)
+        if primeira is None:
+            with self._lock:
+                primeira = self._ligacao.execute(
+                    "SELECT MIN(chave) FROM registos WHERE serie = ?", (serie,)).fetchone()[0]
+            if primeira is not None:
+                self._primeiras[serie] = primeira
+        return primeira
+
+    def ler_intervalo(self, serie, inicio, fim, n):
+        registos = self._ler_local(serie, inicio, fim, n)
+        if self._remoto is None or len(registos) >= n:
+            return registos
+        primeira = self._primeira_chave(serie)
+        if primeira is not None and (serie in self._sem_anteriores or (inicio is not None and inicio >= primeira)):
+            return registos
+
+        # Completa com o que é anterior aos dados locais
+        fim_remoto = fim if primeira is None or (fim is not None and fim < primeira) else primeira
+        try:
+            anteriores = self._remoto.ler_intervalo(serie, inicio, fim_remoto, n - len(registos) + 1)
+        except Exception as e:
+            self.erros_remotos += 1
+            print(f"⚠️ Erro ao ler registos anteriores de {serie} do remoto: {e}")
+            return registos
+        self.leituras_remotas += 1
+        if primeira is not None:
+            anteriores = [registo for registo in anteriores if registo[0] < primeira]
+            if inicio is None and fim_remoto == primeira and not anteriores:
+                # O remoto não tem nada antes da primeira chave local
+                self._sem_anteriores.add(serie)
+        return anteriores[max(0, len(anteriores) - (n - len(registos))):] + registos
+
+    def ler_ultimos(self, serie, n):
+        return self.ler_intervalo(serie, None, None, n)
+
+    def listar_locais(self):
+        with self._lock:
+            series = [linha[0] for linha in self._ligacao.execute(
+                "SELECT serie FROM series WHERE serie LIKE 'sites/%'")]
+        locais = {serie.split("/")[1] for serie in series}
+        if self._remoto is not None:
+            try:
+                locais.update(self._remoto.listar_locais())
+            except Exception as e:
+                self.erros_remotos += 1
+                print(f"⚠️ Erro ao listar aviários do remoto: {e}")
+        return sorted(locais)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "tipo": self.tipo,
+                "caminho": self.caminho,
+                "escritos": self.escritos,
+                "leituras": self.leituras,
+                "leituras_remotas": self.leituras_remotas,
+                "erros_remotos": self.erros_remotos,
+                "escrita_us": round(self.tempo_escrita / self.escritos * 1e6, 1) if self.escritos else None,
+                "leitura_us": round(self.tempo_leitura / self.leituras * 1e6, 1) if self.leituras else None,
+            }
+
+
+# Histórico em memória: por série, as chaves ordenadas e um dicionário com os
+# dados (guardados e devolvidos sem cópia). Substitui o Firebase em testes e
+# benchmarks; perde-se ao terminar o processo.
+class HistoricoMemoria:
+    tipo = "memoria"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # serie -> (chaves ordenadas, {chave: dados})
+        self.escritos = 0
+
+    def _guardar(self, caminho, dados):
+        # Chamado com o lock adquirido
+        serie, _, chave = caminho.rpartition("/")
+        chaves, valores = self._series.setdefault(serie, ([], {}))
+        if chave not in valores:
+            if chaves and chave < chaves[-1]:
+                bisect.insort(chaves, chave)
+            else:
+                chaves.append(chave)
+        valores[chave] = dados
+
+    def escrever_lote(self, registos):
+        with self._lock:
+            for caminho, dados in registos:
+                self._guardar(caminho, dados)
+                self.escritos += 1
+
+    def ler_intervalo(self, serie, inicio, fim, n):
+        with self._lock:
+            chaves, valores = self._series.get(serie, ([], {}))
+            ate = bisect.bisect_right(chaves, fim) if fim is not None else len(chaves)
+            desde = bisect.bisect_left(chaves, inicio) if inicio is not None else 0
+            return [(chave, valores[chave]) for chave in chaves[max(desde, ate - n):ate]]
+
+    def ler_ultimos(self, serie, n):
+        return self.ler_intervalo(serie, None, None, n)
+
+    def listar_locais(self):
+        with self._lock:
+            return sorted({serie.split("/")[1] for serie in self._series if serie.startswith("sites/")})
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "tipo": self.tipo,
+                "series": len(self._series),
+                "registos": sum(len(chaves) for chaves, _ in self._series.values()),
+                "escritos": self.escritos,
+            }
+
+
+# Histórico em memória persistido num ficheiro local de linhas JSON
+# ([caminho, dados] por linha), acrescentado a cada lote e relido ao arrancar.
+# O que vem depois da última linha válida (ex.: uma linha incompleta de um
+# processo terminado a meio da escrita) é cortado ao arrancar, para que o
+# próximo lote não fique colado a esse fragmento.
+class HistoricoFicheiro(HistoricoMemoria):
+    tipo = "ficheiro"
+
+    def __init__(self, caminho):
+        super().__init__()
+        self.caminho = caminho
+        valido = posicao = 0  # Bytes até ao fim da última linha válida / lidos
+        try:
+            with open(caminho, "rb") as ficheiro:
+                for linha in ficheiro:
+                    posicao += len(linha)
+                    if not linha.endswith(b"\n"):
+                        continue
+                    try:
+                        registo_caminho, dados = json.loads(linha)
+                    except ValueError:
+                        continue
+                    self._guardar(registo_caminho, dados)
+                    valido = posicao
+        except FileNotFoundError:
+            pass
+        if valido < posicao:
+            with open(caminho, "r+b") as ficheiro:
+                ficheiro.truncate(valido)
+            print(f"⚠️ Histórico {caminho}: {posicao - valido} byte(s) inválidos no fim do ficheiro cortados.")
+        self._ficheiro = open(caminho, "a", encoding="utf-8")
+
+    def escrever_lote(self, registos):
+        linhas = "".join(json.dumps([caminho, dados], separators=(",", ":")) + "\n" for caminho, dados in registos)
+        with self._lock:
+            self._ficheiro.write(linhas)
+            self._ficheiro.flush()
+            for caminho, dados in registos:
+                self._guardar(caminho, dados)
+                self.escritos += 1
+
+    def metricas(self):
+        return dict(super().metricas(), caminho=self.caminho)
+
+
+# `caminho` é o ficheiro dos backends locais; `remoto` (ex.: HistoricoFirebase)
+# completa as leituras do SQLite com o que é anterior aos dados locais
+def criar_historico(tipo, caminho=None, remoto=None):
+    if tipo == "firebase":
+        return HistoricoFirebase()
+    if tipo == "sqlite":
+        return HistoricoSQLite(caminho, remoto=remoto)
+    if tipo == "memoria":
+        return HistoricoMemoria()
+    if tipo == "ficheiro":
+        return HistoricoFicheiro(caminho)
+    raise ValueError(f"Backend de histórico desconhecido: {tipo}")
@@ -0,0 +1,61 @@
+import threading
+import time
+
+# Estados de um subsistema
+PENDENTE = "pendente"
+PRONTO = "pronto"
+ERRO = "erro"
+DESATIVADO = "desativado"  # Não usado neste processo (ex.: MQTT num seguidor)
+
+
+# Arranque diferido: a aplicação web fica disponível assim que o módulo é
+# importado e os subsistemas lentos (Firebase, hidratação, MQTT) arrancam em
+# segundo plano. Cada subsistema tem um estado e o instante (ms desde `inicio`,
+# o início da importação da aplicação) em que lá chegou; a aplicação está
+# pronta quando nenhum subsistema ativo está pendente ou em erro.
+class Arranque:
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self._lock = threading.Lock()
+        self._subsistemas = {}
+        self.importacao_ms = None
+        self.primeiro_pedido_ms = None
+
+    def _ms(self):
+        return round((time.perf_counter() - self.inicio) * 1000, 1)
+
+    def marcar(self, nome, estado, erro=None):
+        with self._lock:
+            self._subsistemas[nome] = {"estado": estado, "ms": self._ms(), "erro": erro}
+
+    def executar(self, nome, funcao):
+        # Corre o passo de arranque `funcao` e marca o subsistema como pronto
+        # (ou em erro, sem propagar a exceção)
+        self.marcar(nome, PENDENTE)
+        try:
+            funcao()
+        except Exception as e:
+            self.marcar(nome, ERRO, str(e))
+            print(f"❌ Erro ao arrancar {nome}: {e}")
+            return False
+        self.marcar(nome, PRONTO)
+        print(f"✅ {nome} pronto ({self._subsistemas[nome]['ms']:.0f} ms desde o arranque).")
+        return True
+
+    def importacao_concluida(self):
+        self.importacao_ms = self._ms()
+
+    def registar_pedido(self):
+        # Tempo até à primeira resposta HTTP deste processo
+        if self.primeiro_pedido_ms is None:
+            self.primeiro_pedido_ms = self._ms()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "pronto": all(subsistema["estado"] in (PRONTO, DESATIVADO)
+                              for subsistema in self._subsistemas.values()),
+                "importacao_ms": self.importacao_ms,
+                "primeiro_pedido_ms": self.primeiro_pedido_ms,
+                "subsistemas": {nome: dict(subsistema) for nome, subsistema in self._subsistemas.items()},
+            }
@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+
+# Canais usados entre o processo de ingestão e os workers web
+CANAL_SNAPSHOTS = "snapshots"  # Ingestão -> web: {"chave": ..., "dados": snapshot}
+CANAL_COMANDOS = "comandos"    # Web -> ingestão: {"topico": ..., "payload": ...}
+
+
+def _entregar(callbacks, canal, mensagem):
+    for callback in callbacks:
+        try:
+            callback(mensagem)
+        except Exception as e:
+            print(f"❌ Erro ao processar mensagem do canal '{canal}': {e}")
+
+
+# Barramento em memória: entrega as mensagens aos subscritores do mesmo
+# processo, na thread de quem publica. É o modo de um único processo (papel
+# "completo") e serve de substituto do Redis em testes.
+class BarramentoLocal:
+    def __init__(self):
+        self._subscritores = {}
+        self._lock = threading.Lock()
+        self.publicadas = 0
+        self.recebidas = 0
+
+    def subscrever(self, canal, callback):
+        self._subscritores.setdefault(canal, []).append(callback)
+
+    def iniciar(self):
+        pass
+
+    def publicar(self, canal, mensagem):
+        callbacks = self._subscritores.get(canal, ())
+        with self._lock:
+            self.publicadas += 1
+            self.recebidas += bool(callbacks)
+        _entregar(callbacks, canal, mensagem)
+
+    def metricas(self):
+        with self._lock:
+            return {"tipo": "memoria", "publicadas": self.publicadas, "recebidas": self.recebidas}
+
+
+# Barramento Redis (pub/sub) para vários processos/instâncias: um processo de
+# ingestão publica e qualquer número de workers web recebe. Requer o pacote
+# `redis`, que só é importado quando este modo é configurado.
+#
+# Se a ligação de subscrição cair, a thread volta a ligar e a subscrever com
+# espera exponencial (de `espera_min` até `espera_max` segundos); as mensagens
+# publicadas entretanto perdem-se (pub/sub não guarda histórico). Cada mudança
+# de estado é comunicada a `ao_mudar_estado(ligado, erro)`.
+class BarramentoRedis:
+    def __init__(self, url, prefixo="aviario", ao_mudar_estado=None, espera_min=0.5, espera_max=30.0):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("O barramento Redis requer o pacote 'redis' (pip install redis).")
+        self._redis = redis.Redis.from_url(url)
+        self._prefixo = prefixo
+        self._subscritores = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ao_mudar_estado = ao_mudar_estado
+        self.espera_min = espera_min
+        self.espera_max = espera_max
+        self.publicadas = 0
+        self.recebidas = 0
+        self.ligado = False
+        self.religacoes = 0
+        self.ultimo_erro = None
+
+    def _canal(self, canal):
+        return f"{self._prefixo}:{canal}"
+
+    def subscrever(self, canal, callback):
+        # As subscrições têm de ser feitas antes de iniciar()
+        self._subscritores.setdefault(canal, []).append(callback)
+
+    def iniciar(self):
+        if self._thread is not None or not self._subscritores:
+            return
+        self._mudar_estado(False, None)
+        self._thread = threading.Thread(target=self._escutar, name="barramento-redis")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _mudar_estado(self, ligado, erro):
+        with self._lock:
+            self.ligado = ligado
+            if erro is not None:
+                self.ultimo_erro = erro
+        if self._ao_mudar_estado is not None:
+            self._ao_mudar_estado(ligado, erro)
+
+    def _escutar(self):
+        espera = self.espera_min
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(*[self._canal(canal) for canal in self._subscritores])
+                self._mudar_estado(True, None)
+                espera = self.espera_min
+                for mensagem in pubsub.listen():
+                    canal = mensagem["channel"].decode("utf-8")[len(self._prefixo) + 1:]
+                    with self._lock:
+                        self.recebidas += 1
+                    _entregar(self._subscritores.get(canal, ()), canal, json.loads(mensagem["data"]))
+            except Exception as e:
+                self._mudar_estado(False, str(e))
+                print(f"⚠️ Barramento Redis desligado ({e}); nova ligação dentro de {espera:.1f} s.")
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(espera)
+            espera = min(espera * 2, self.espera_max)
+            with self._lock:
+                self.religacoes += 1
+
+    def publicar(self, canal, mensagem):
+        self._redis.publish(self._canal(canal), json.dumps(mensagem))
+        with self._lock:
+            self.publicadas += 1
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "tipo": "redis",
+                "publicadas": self.publicadas,
+                "recebidas": self.recebidas,
+                "ligado": self.ligado,
+                "religacoes": self.religacoes,
+                "ultimo_erro": self.ultimo_erro,
+            }
+
+
+def criar_barramento(url, ao_mudar_estado=None):
+    if not url or url.startswith("memoria://"):
+        return BarramentoLocal()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return BarramentoRedis(url, ao_mudar_estado=ao_mudar_estado)
+    raise ValueError(f"URL de barramento não suportado: {url}")
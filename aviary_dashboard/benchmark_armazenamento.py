@@ -0,0 +1,84 @@
+# Mede o débito do caminho de persistência (fila de escrita em lotes + backend
+# do histórico) e a latência das leituras de intervalos, para os backends
+# locais (memória, ficheiro e SQLite, num diretório temporário). Não liga ao
+# Firebase nem ao broker, pelo que os resultados são reprodutíveis offline.
+# Uso: python benchmark_armazenamento.py [registos] [backend ...]
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from armazenamento import criar_historico
+from fila_escrita import FilaEscrita
+from firebase import caminho_historico, gerar_chave_historico, serie_historico
+
+BACKENDS = ("memoria", "ficheiro", "sqlite")
+FICHEIROS = {"ficheiro": "historico.jsonl", "sqlite": "historico.db"}
+TAMANHO_LOTE = 50
+
+
+def registos(n):
+    # Um registo a cada 5 s, como a ingestão, a terminar agora
+    agora = datetime.now()
+    for i in range(n):
+        instante = agora - timedelta(seconds=5 * (n - i))
+        yield caminho_historico(gerar_chave_historico(instante)), {
+            "temperatura": round(random.uniform(18.0, 32.0), 1),
+            "humidade": round(random.uniform(40.0, 80.0), 1),
+            "luminosidade": random.randint(0, 1023),
+            "gas": random.random() < 0.05,
+            "ventoinha": random.random() < 0.5,
+            "janela": random.random() < 0.5,
+            "timestamp": instante.strftime("%H:%M:%S"),
+        }
+
+
+def medir_escrita(historico, dados):
+    # Registo a registo pela fila de escrita, como o persistir() da aplicação
+    fila = FilaEscrita(historico.escrever_lote, max_profundidade=len(dados), tamanho_lote=TAMANHO_LOTE)
+    fila.iniciar()
+    inicio = time.perf_counter()
+    for registo in dados:
+        fila.enfileirar(registo)
+    while True:
+        metricas = fila.metricas()
+        if metricas["escritos"] + metricas["falhados"] >= len(dados):
+            break
+        time.sleep(0.001)
+    return len(dados) / (time.perf_counter() - inicio), metricas["falhados"]
+
+
+def medir_leituras(historico, dados, repeticoes):
+    serie = serie_historico()
+    chaves = [caminho.rpartition("/")[2] for caminho, _ in dados]
+    meio = chaves[len(chaves) // 2]
+    consultas = [
+        ("últimos 15", lambda: historico.ler_ultimos(serie, 15)),
+        ("últimos 1000", lambda: historico.ler_ultimos(serie, 1000)),
+        ("intervalo 100", lambda: historico.ler_intervalo(serie, meio, None, 100)),
+    ]
+    return [(nome, timeit.timeit(consulta, number=repeticoes) / repeticoes * 1e6) for nome, consulta in consultas]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    backends = sys.argv[2:] or BACKENDS
+    random.seed(2025)
+    dados = list(registos(n))
+    print(f"{n} registos, lotes de {TAMANHO_LOTE}")
+    print(f"{'backend':<10} {'escrita reg/s':>14} {'consulta':<14} {'leitura µs':>11}")
+    with tempfile.TemporaryDirectory() as diretorio:
+        for backend in backends:
+            caminho = os.path.join(diretorio, FICHEIROS[backend]) if backend in FICHEIROS else None
+            historico = criar_historico(backend, caminho=caminho)
+            debito, falhados = medir_escrita(historico, dados)
+            print(f"{backend:<10} {debito:>14.0f}" + (f"  ({falhados} falhados)" if falhados else ""))
+            for nome, micros in medir_leituras(historico, dados, 200):
+                print(f"{'':<10} {'':>14} {nome:<14} {micros:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Mede o arranque a frio: lança o gunicorn (como o entrypoint do App Engine),
+# regista o tempo até ao primeiro byte da primeira resposta HTTP e depois até
+# /api/prontidao indicar todos os subsistemas prontos, com os instantes de cada
+# um. Compara ARRANQUE_DIFERIDO=1 com ARRANQUE_DIFERIDO=0 passando-o no ambiente.
+# Uso: python benchmark_arranque.py [repetições] [porta]
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+LIMITE_S = 120
+
+
+def pedir(url):
+    # Devolve (estado, corpo) ou None se o servidor ainda não aceita ligações
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resposta:
+            return resposta.status, resposta.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None
+
+
+def medir(porta):
+    base = f"http://127.0.0.1:{porta}"
+    comando = [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{porta}", "-c", "gunicorn.conf.py", "app:app"]
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        primeiro_byte = pronto = None
+        prontidao = {}
+        while time.perf_counter() - inicio < LIMITE_S:
+            resultado = pedir(f"{base}/api/prontidao")
+            if resultado is not None:
+                if primeiro_byte is None:
+                    primeiro_byte = time.perf_counter() - inicio
+                estado, corpo = resultado
+                prontidao = json.loads(corpo)
+                if estado == 200:
+                    pronto = time.perf_counter() - inicio
+                    break
+            time.sleep(0.02)
+        return primeiro_byte, pronto, prontidao
+    finally:
+        processo.terminate()
+        processo.wait()
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    porta = int(sys.argv[2]) if len(sys.argv) > 2 else 8089
+    print(f"ARRANQUE_DIFERIDO={os.getenv('ARRANQUE_DIFERIDO', '1')}")
+    for i in range(repeticoes):
+        primeiro_byte, pronto, prontidao = medir(porta)
+        linha = f"#{i + 1}  primeiro byte: {primeiro_byte * 1000:.0f} ms" if primeiro_byte else f"#{i + 1}  sem resposta"
+        linha += f"  pronto: {pronto * 1000:.0f} ms" if pronto else "  não ficou pronto"
+        print(linha)
+        if prontidao:
+            print(f"    importação da aplicação: {prontidao.get('importacao_ms')} ms")
+            for nome, subsistema in prontidao.get("subsistemas", {}).items():
+                print(f"    {nome:<12} {subsistema['estado']:<11} {subsistema['ms']} ms"
+                      + (f"  ({subsistema['erro']})" if subsistema.get("erro") else ""))
+
+
+if __name__ == '__main__':
+    main()
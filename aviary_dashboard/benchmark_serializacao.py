@@ -0,0 +1,81 @@
+# Compara o tamanho dos frames e o tempo de codificação/descodificação do canal
+# Socket.IO com JSON e com MessagePack (SOCKETIO_SERIALIZADOR), para o estado
+# atual, um delta e páginas de histórico. Não liga ao Firebase nem ao broker.
+# Uso: python benchmark_serializacao.py [repetições]
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from engineio import packet as eio_packet
+from socketio import msgpack_packet, packet
+
+from agregados import RESOLUCOES
+from difusao import EVENTO_DELTA, EVENTO_SNAPSHOT
+
+SERIALIZADORES = {"json": packet.Packet, "msgpack": msgpack_packet.MsgPackPacket}
+
+
+def registo(instante):
+    return {
+        "temperatura": round(random.uniform(18.0, 32.0), 1),
+        "humidade": round(random.uniform(40.0, 80.0), 1),
+        "luminosidade": random.randint(0, 1023),
+        "gas": random.random() < 0.05,
+        "ventoinha": random.random() < 0.5,
+        "janela": random.random() < 0.5,
+        "timestamp": instante.strftime("%H:%M:%S"),
+    }
+
+
+def agregado(instante):
+    resumo = {}
+    for campo in ("temperatura", "humidade", "luminosidade"):
+        minimo = random.uniform(0, 50)
+        resumo[campo] = {"min": minimo, "max": minimo + 5, "media": minimo + 2.5, "contagem": 60}
+    resumo["timestamp"] = instante.strftime("%H:%M:%S")
+    return resumo
+
+
+def cargas():
+    agora = datetime.now()
+    historico = [registo(agora - timedelta(seconds=5 * i)) for i in range(1000)][::-1]
+    agregados = [agregado(agora - timedelta(seconds=RESOLUCOES["1m"] * i)) for i in range(60)][::-1]
+    return [
+        ("estado (snapshot)", EVENTO_SNAPSHOT, dict(registo(agora), seq=1234)),
+        ("delta", EVENTO_DELTA, {"seq": 1235, "base": 1234, "dados": {"temperatura": 24.5, "timestamp": "12:00:05"}}),
+        ("histórico 15", "historico", historico[-15:]),
+        ("histórico 1000", "historico", historico),
+        ("agregados 1m x 60", "historico", agregados),
+    ]
+
+
+def frame(classe, evento, dados):
+    # Frame tal como segue no WebSocket: pacote Engine.IO com o pacote Socket.IO
+    codificado = classe(packet.EVENT, namespace="/", data=[evento, dados]).encode()
+    return eio_packet.Packet(eio_packet.MESSAGE, codificado).encode()
+
+
+def medir(classe, evento, dados, repeticoes):
+    codificado = classe(packet.EVENT, namespace="/", data=[evento, dados]).encode()
+    codificar = timeit.timeit(
+        lambda: classe(packet.EVENT, namespace="/", data=[evento, dados]).encode(), number=repeticoes)
+    descodificar = timeit.timeit(lambda: classe(encoded_packet=codificado), number=repeticoes)
+    return len(frame(classe, evento, dados)), codificar / repeticoes * 1e6, descodificar / repeticoes * 1e6
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random.seed(2025)
+    print(f"{'carga':<20} {'serializador':<12} {'bytes':>8} {'codificar µs':>14} {'descodificar µs':>16}")
+    for nome, evento, dados in cargas():
+        tamanhos = {}
+        for serializador, classe in SERIALIZADORES.items():
+            tamanho, codificar, descodificar = medir(classe, evento, dados, repeticoes)
+            tamanhos[serializador] = tamanho
+            print(f"{nome:<20} {serializador:<12} {tamanho:>8} {codificar:>14.1f} {descodificar:>16.1f}")
+        print(f"{'':<20} {'msgpack/json':<12} {tamanhos['msgpack'] / tamanhos['json']:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
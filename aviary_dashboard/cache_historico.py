@@ -0,0 +1,149 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+_NAN = float("nan")
+
+
+# Vista ordenada (do mais antigo para o mais recente) das chaves do buffer
+# circular, para pesquisa binária com o módulo bisect.
+class _VistaChaves:
+    def __init__(self, buffer):
+        self._buffer = buffer
+
+    def __len__(self):
+        return self._buffer._tamanho
+
+    def __getitem__(self, i):
+        return self._buffer._chaves[self._buffer._posicao(i)]
+
+
+# Buffer circular em memória com os registos mais recentes do histórico.
+# Cada campo é guardado numa coluna compacta (array) em vez de um dict por
+# registo: decimais/inteiros em 'd' (NaN = None) e binários em 'b' (-1 = None).
+# `campos` mapeia o nome do campo para "decimal", "inteiro" ou "binario".
+class BufferHistorico:
+    def __init__(self, campos, capacidade=2000):
+        self.capacidade = capacidade
+        self._campos = dict(campos)
+        self._colunas = {
+            campo: array('b', [-1]) * capacidade if tipo == "binario" else array('d', [_NAN]) * capacidade
+            for campo, tipo in self._campos.items()
+        }
+        self._chaves = [None] * capacidade
+        self._horas = [None] * capacidade
+        self._inicio = 0
+        self._tamanho = 0
+        self._lock = threading.Lock()
+        self.aquecido = False
+        self.completo = False  # O buffer contém todo o histórico persistido
+        self.acertos = 0
+        self.falhas = 0
+
+    def __len__(self):
+        return self._tamanho
+
+    def _escrever(self, posicao, chave, registo):
+        self._chaves[posicao] = chave
+        self._horas[posicao] = registo.get("timestamp")
+        for campo, tipo in self._campos.items():
+            valor = registo.get(campo)
+            # Valores em falta ou com tipo inesperado (registos antigos) ficam a None
+            if tipo == "binario":
+                self._colunas[campo][posicao] = int(bool(valor)) if isinstance(valor, (bool, int)) else -1
+            else:
+                self._colunas[campo][posicao] = valor if isinstance(valor, (int, float)) else _NAN
+
+    def _ler(self, posicao):
+        registo = {}
+        for campo, tipo in self._campos.items():
+            valor = self._colunas[campo][posicao]
+            if tipo == "binario":
+                registo[campo] = None if valor < 0 else bool(valor)
+            elif math.isnan(valor):
+                registo[campo] = None
+            else:
+                registo[campo] = int(valor) if tipo == "inteiro" else valor
+        registo["timestamp"] = self._horas[posicao]
+        return registo
+
+    def adicionar(self, chave, registo):
+        with self._lock:
+            if self._tamanho < self.capacidade:
+                posicao = (self._inicio + self._tamanho) % self.capacidade
+                self._tamanho += 1
+            else:
+                # Buffer cheio: o registo mais antigo é substituído
+                posicao = self._inicio
+                self._inicio = (self._inicio + 1) % self.capacidade
+                self.completo = False
+            self._escrever(posicao, chave, registo)
+
+    def carregar(self, registos, completo=False):
+        # Aquecimento: junta os registos persistidos (lista de (chave, dados)) com
+        # os que a ingestão já tiver adicionado entretanto, mantendo a ordem das chaves.
+        with self._lock:
+            existentes = [(self._chaves[p], self._ler(p)) for p in self._posicoes(self._tamanho)]
+            por_chave = {chave: dados for chave, dados in registos if isinstance(dados, dict)}
+            por_chave.update(existentes)
+            ordenados = sorted(por_chave.items(), key=lambda x: x[0])[-self.capacidade:]
+            self._inicio = 0
+            self._tamanho = len(ordenados)
+            for posicao, (chave, dados) in enumerate(ordenados):
+                self._escrever(posicao, chave, dados)
+            self.completo = completo and len(por_chave) <= self.capacidade
+            self.aquecido = True
+
+    def _posicao(self, i):
+        # Posição no array do i-ésimo registo (0 = mais antigo)
+        return (self._inicio + i) % self.capacidade
+
+    def _posicoes(self, n):
+        # Posições dos últimos `n` registos, do mais antigo para o mais recente
+        n = min(n, self._tamanho)
+        primeiro = self._tamanho - n
+        return [self._posicao(primeiro + i) for i in range(n)]
+
+    def ultima_chave(self):
+        # Chave do registo mais recente (versão do histórico), ou None se o
+        # buffer ainda não foi aquecido ou está vazio
+        with self._lock:
+            if not self.aquecido or not self._tamanho:
+                return None
+            return self._chaves[self._posicao(self._tamanho - 1)]
+
+    def intervalo(self, inicio=None, fim=None, limite=15):
+        # Devolve os últimos `limite` registos com chave em [inicio, fim] como
+        # lista de (chave, dados), ou None se o buffer não cobre o pedido.
+        with self._lock:
+            if not self.aquecido:
+                self.falhas += 1
+                return None
+            chaves = _VistaChaves(self)
+            baixo = bisect_left(chaves, inicio) if inicio is not None else 0
+            alto = bisect_right(chaves, fim) if fim is not None else self._tamanho
+            # O buffer guarda um sufixo contíguo do histórico: responde se tiver
+            # todo o histórico, registos suficientes no intervalo, ou se o
+            # intervalo começar depois do registo mais antigo em memória.
+            cobre = (
+                self.completo
+                or alto - baixo >= limite
+                or (inicio is not None and self._tamanho > 0 and inicio >= chaves[0])
+            )
+            if not cobre:
+                self.falhas += 1
+                return None
+            self.acertos += 1
+            return [(chaves[i], self._ler(self._posicao(i))) for i in range(max(baixo, alto - limite), alto)]
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "tamanho": self._tamanho,
+                "capacidade": self.capacidade,
+                "aquecido": self.aquecido,
+                "completo": self.completo,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+            }
@@ -0,0 +1,76 @@
+import threading
+
+# Modos de ingestão
+MODO_IMEDIATO = "imediato"  # Um snapshot por mensagem MQTT (comportamento original)
+MODO_JANELA = "janela"      # Um snapshot por janela de tempo, com todas as alterações acumuladas
+MODO_TODOS = "todos"        # Um snapshot quando todos os tópicos foram vistos (a janela serve de limite máximo)
+MODOS = (MODO_IMEDIATO, MODO_JANELA, MODO_TODOS)
+
+
+# Junta as atualizações de vários tópicos num único snapshot: em vez de cada
+# tópico gerar um emit e uma escrita, `publicar` é chamado uma vez por ciclo.
+class Coalescedor:
+    def __init__(self, publicar, modo=MODO_JANELA, janela=0.25, topicos_esperados=()):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de coalescência desconhecido: {modo}")
+        self._publicar = publicar
+        self.modo = modo
+        self.janela = janela
+        self.topicos_esperados = frozenset(topicos_esperados)
+        self._lock = threading.Lock()
+        self._vistos = set()
+        self._timer = None
+        self._geracao = 0
+        self.atualizacoes = 0
+        self.snapshots = 0
+
+    def registar(self, topico):
+        with self._lock:
+            self.atualizacoes += 1
+            self._vistos.add(topico)
+            if self.modo == MODO_IMEDIATO:
+                publicar_agora = True
+            elif self.modo == MODO_TODOS and self.topicos_esperados <= self._vistos:
+                publicar_agora = True
+            else:
+                publicar_agora = False
+                if self._timer is None:
+                    self._timer = threading.Timer(self.janela, self._expirar, args=(self._geracao,))
+                    self._timer.daemon = True
+                    self._timer.start()
+            if publicar_agora:
+                self._fechar_ciclo()
+        if publicar_agora:
+            self._emitir()
+
+    def _fechar_ciclo(self):
+        # Chamado com o lock adquirido
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._vistos.clear()
+        self._geracao += 1
+        self.snapshots += 1
+
+    def _expirar(self, geracao):
+        with self._lock:
+            # Um timer de um ciclo já publicado (cancelado tarde demais) é ignorado
+            if geracao != self._geracao or not self._vistos:
+                return
+            self._fechar_ciclo()
+        self._emitir()
+
+    def _emitir(self):
+        try:
+            self._publicar()
+        except Exception as e:
+            print(f"❌ Erro ao publicar snapshot coalescido: {e}")
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "modo": self.modo,
+                "janela_ms": int(self.janela * 1000),
+                "atualizacoes": self.atualizacoes,
+                "snapshots": self.snapshots,
+            }
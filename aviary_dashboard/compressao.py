@@ -0,0 +1,161 @@
+import gzip
+import threading
+import time
+
+# Níveis pensados para respostas dinâmicas: boa redução sem grande custo de CPU
+NIVEL_GZIP = 6
+QUALIDADE_BROTLI = 5
+
+
+# Bytes poupados versus tempo gasto a comprimir
+class ContadorCompressao:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.comprimidos = 0
+        self.ignorados = 0  # Abaixo do limiar (ou sem compressão aceite)
+        self.bytes_originais = 0
+        self.bytes_comprimidos = 0
+        self.tempo = 0.0
+
+    def registar(self, original, comprimido, segundos):
+        with self._lock:
+            self.comprimidos += 1
+            self.bytes_originais += original
+            self.bytes_comprimidos += comprimido
+            self.tempo += segundos
+
+    def ignorar(self):
+        with self._lock:
+            self.ignorados += 1
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "comprimidos": self.comprimidos,
+                "ignorados": self.ignorados,
+                "bytes_originais": self.bytes_originais,
+                "bytes_comprimidos": self.bytes_comprimidos,
+                "bytes_poupados": self.bytes_originais - self.bytes_comprimidos,
+                "razao": round(self.bytes_originais / self.bytes_comprimidos, 2) if self.bytes_comprimidos else None,
+                "tempo_ms": round(self.tempo * 1000, 3),
+            }
+
+
+# --- Respostas HTTP ---
+# Comprime as respostas JSON com pelo menos `min_bytes` em br (se o pacote
+# `brotli` estiver instalado e o cliente o aceitar) ou gzip.
+class CompressorHttp:
+    def __init__(self, min_bytes=1024):
+        self.min_bytes = min_bytes
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        self._brotli = brotli
+        self.contador = ContadorCompressao()
+
+    def _codificacao(self, aceites):
+        # Codificações do cabeçalho Accept-Encoding que não têm q=0
+        codificacoes = set()
+        for parte in aceites.split(","):
+            nome, _, parametros = parte.partition(";")
+            parametros = parametros.replace(" ", "")
+            if parametros.startswith("q="):
+                try:
+                    if float(parametros[2:]) == 0:
+                        continue
+                except ValueError:
+                    continue
+            codificacoes.add(nome.strip().lower())
+        if self._brotli is not None and "br" in codificacoes:
+            return "br"
+        if "gzip" in codificacoes:
+            return "gzip"
+        return None
+
+    def comprimir(self, resposta, aceites):
+        if resposta.direct_passthrough or resposta.status_code != 200 or resposta.mimetype != "application/json" \
+                or "Content-Encoding" in resposta.headers:
+            return resposta
+        resposta.vary.add("Accept-Encoding")
+        dados = resposta.get_data()
+        codificacao = self._codificacao(aceites or "")
+        if len(dados) < self.min_bytes or codificacao is None:
+            self.contador.ignorar()
+            return resposta
+
+        inicio = time.perf_counter()
+        if codificacao == "br":
+            comprimido = self._brotli.compress(dados, quality=QUALIDADE_BROTLI)
+        else:
+            comprimido = gzip.compress(dados, compresslevel=NIVEL_GZIP)
+        self.contador.registar(len(dados), len(comprimido), time.perf_counter() - inicio)
+        resposta.set_data(comprimido)
+        resposta.headers["Content-Encoding"] = codificacao
+        return resposta
+
+    def metricas(self):
+        return dict(self.contador.metricas(), min_bytes=self.min_bytes, brotli=self._brotli is not None)
+
+
+# --- WebSocket (permessage-deflate) ---
+# O servidor WebSocket do eventlet negoceia o permessage-deflate sempre que o
+# browser o oferece e comprime todos os frames. Aqui substitui-se a classe
+# WebSocket do Engine.IO para: não negociar a extensão (ativo=False), ou enviar
+# sem compressão os frames com menos de `min_bytes` (o RFC 7692 permite frames
+# não comprimidos, com RSV1 a 0, numa ligação com a extensão) e contar bytes e
+# tempo dos restantes. Devolve False se o modo assíncrono não for o eventlet
+# (ex.: servidor de desenvolvimento), em que o WebSocket não comprime.
+def configurar_deflate_websocket(socketio, ativo=True, min_bytes=256, contador=None):
+    eio = socketio.server.eio
+    if eio.async_mode != "eventlet" or not eio._async.get("websocket"):
+        return False
+    base = eio._async["websocket"]
+
+    class WebSocketComLimiar(base):
+        def __init__(self, handler, server):
+            def handler_com_limiar(ws):
+                _limitar_deflate(ws, min_bytes, contador)
+                return handler(ws)
+            super().__init__(handler_com_limiar, server)
+
+        def __call__(self, environ, start_response):
+            if not ativo:
+                environ.pop("HTTP_SEC_WEBSOCKET_EXTENSIONS", None)
+            return super().__call__(environ, start_response)
+
+    # Cópia própria: o dicionário do driver é partilhado por todos os servidores
+    eio._async = dict(eio._async, websocket=WebSocketComLimiar)
+    return True
+
+
+def _limitar_deflate(ws, min_bytes, contador):
+    if "permessage-deflate" not in getattr(ws, "extensions", {}):
+        return
+    empacotar = ws._pack_message
+    compressor_original = ws._get_permessage_deflate_enc
+    estado = {"comprimir": True}
+    ws._get_permessage_deflate_enc = lambda: compressor_original() if estado["comprimir"] else None
+
+    def empacotar_com_limiar(mensagem, *args, **kwargs):
+        if kwargs.get("control_code"):
+            return empacotar(mensagem, *args, **kwargs)
+        # O limiar e a razão contam bytes: as mensagens de texto vão em UTF-8
+        tamanho = len(mensagem.encode("utf-8")) if isinstance(mensagem, str) else len(mensagem)
+        if tamanho < min_bytes:
+            # O empacotamento não cede o controlo a outras greenlets, pelo que
+            # o estado não é visto por outro envio
+            estado["comprimir"] = False
+            try:
+                return empacotar(mensagem, *args, **kwargs)
+            finally:
+                estado["comprimir"] = True
+                if contador is not None:
+                    contador.ignorar()
+        inicio = time.perf_counter()
+        frame = empacotar(mensagem, *args, **kwargs)
+        if contador is not None:
+            contador.registar(tamanho, len(frame), time.perf_counter() - inicio)
+        return frame
+
+    ws._pack_message = empacotar_com_limiar
@@ -0,0 +1,287 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Políticas de fsync do segmento atual
+FSYNC_SEMPRE = "sempre"        # Cada registo chega ao disco antes de ser enfileirado
+FSYNC_INTERVALO = "intervalo"  # No máximo um fsync por `intervalo_fsync` segundos
+FSYNC_NUNCA = "nunca"          # O sistema operativo decide (sobrevive à morte do processo)
+POLITICAS_FSYNC = (FSYNC_SEMPRE, FSYNC_INTERVALO, FSYNC_NUNCA)
+
+# Cada registo: comprimento e crc32 do conteúdo (big-endian) seguidos do JSON
+CABECALHO = struct.Struct(">II")
+EXTENSAO = ".wal"
+FICHEIRO_CONFIRMADO = "confirmado"
+
+
+# Diário de escrita antecipada (WAL) dos registos enviados ao Firebase. Cada
+# registo é acrescentado a um segmento local antes de ir para a fila de
+# escrita; depois de o lote ser escrito no destino, a posição é confirmada e
+# os segmentos totalmente confirmados são apagados. Os registos não
+# confirmados (falha do destino, fila cheia, ou processo terminado) são
+# reenviados por uma thread própria, incluindo os de uma execução anterior ao
+# abrir o diário. As escritas no Firebase são por caminho, por isso reenviar um
+# registo já escrito é inofensivo.
+#
+# As posições são (segmento, fim do registo no segmento) e só avançam: um lote
+# só é confirmado se não houver registos anteriores por enviar; caso contrário
+# o reenvio cobre-o (já está no diário).
+class DiarioEscrita:
+    def __init__(self, escrever, diretorio, tamanho_segmento=4 * 1024 * 1024, fsync=FSYNC_INTERVALO,
+                 intervalo_fsync=1.0, tamanho_lote=50, intervalo_reenvio=10.0):
+        if fsync not in POLITICAS_FSYNC:
+            raise ValueError(f"Política de fsync desconhecida: {fsync}")
+        self._escrever = escrever
+        self.diretorio = diretorio
+        self.tamanho_segmento = tamanho_segmento
+        self.fsync = fsync
+        self.intervalo_fsync = intervalo_fsync
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.intervalo_reenvio = intervalo_reenvio
+        self._lock = threading.Lock()        # Segmento atual
+        self._lock_envio = threading.Lock()  # Envios ao destino (lotes e reenvio)
+        self._aberto = False
+        self._bloqueio = None
+        self._ficheiro = None
+        self._segmento = 0
+        self._tamanho = 0
+        self._ultimo_fsync = 0.0
+        self._confirmado = (0, 0)
+        self._pendente = False
+        self.acrescentados = 0
+        self.confirmados = 0
+        self.reenviados = 0
+        self.fora_da_fila = 0
+        self.fsyncs = 0
+        self.tempo_acrescentar = 0.0
+
+    # --- Ficheiros ---
+    def _caminho_segmento(self, numero):
+        return os.path.join(self.diretorio, f"{numero:010d}{EXTENSAO}")
+
+    def _segmentos(self):
+        return sorted(int(nome[:-len(EXTENSAO)]) for nome in os.listdir(self.diretorio) if nome.endswith(EXTENSAO))
+
+    def _ler_segmento(self, numero, inicio=0, fim=None):
+        # Registos válidos do segmento a partir de `inicio` (e até `fim`), como
+        # ((numero, fim do registo), registo); para num registo incompleto ou corrompido
+        with open(self._caminho_segmento(numero), "rb") as ficheiro:
+            ficheiro.seek(inicio)
+            posicao = inicio
+            while fim is None or posicao < fim:
+                cabecalho = ficheiro.read(CABECALHO.size)
+                if len(cabecalho) < CABECALHO.size:
+                    return
+                comprimento, crc = CABECALHO.unpack(cabecalho)
+                dados = ficheiro.read(comprimento)
+                if len(dados) < comprimento or zlib.crc32(dados) != crc:
+                    print(f"⚠️ Registo inválido no diário (segmento {numero}, posição {posicao}).")
+                    return
+                posicao += CABECALHO.size + comprimento
+                caminho, registo = json.loads(dados)
+                yield (numero, posicao), (caminho, registo)
+
+    def _abrir_segmento(self, numero, tamanho=0):
+        self._ficheiro = open(self._caminho_segmento(numero), "ab")
+        self._segmento = numero
+        self._tamanho = tamanho
+
+    def _sincronizar(self):
+        self._ficheiro.flush()
+        os.fsync(self._ficheiro.fileno())
+        self._ultimo_fsync = time.monotonic()
+        self.fsyncs += 1
+
+    # --- Abertura / Fecho ---
+    def abrir(self):
+        # Bloqueia o diretório (um processo por diretório), recupera o segmento
+        # atual (descartando um registo final incompleto) e inicia o reenvio
+        with self._lock:
+            if self._aberto:
+                return
+            import fcntl
+            os.makedirs(self.diretorio, exist_ok=True)
+            bloqueio = open(os.path.join(self.diretorio, ".lock"), "a+")
+            try:
+                fcntl.flock(bloqueio, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                bloqueio.close()
+                raise RuntimeError(f"O diário {self.diretorio} está a ser usado por outro processo.")
+            self._bloqueio = bloqueio
+
+            try:
+                with open(os.path.join(self.diretorio, FICHEIRO_CONFIRMADO)) as ficheiro:
+                    segmento, posicao = ficheiro.read().split()
+                    self._confirmado = (int(segmento), int(posicao))
+            except (FileNotFoundError, ValueError):
+                self._confirmado = (0, 0)
+
+            segmentos = self._segmentos()
+            if segmentos:
+                ultimo = segmentos[-1]
+                fim = 0
+                for (_, fim), _ in self._ler_segmento(ultimo):
+                    pass
+                with open(self._caminho_segmento(ultimo), "r+b") as ficheiro:
+                    ficheiro.truncate(fim)
+                self._abrir_segmento(ultimo, fim)
+            else:
+                self._abrir_segmento(self._confirmado[0] + 1)
+            self._pendente = next(self._pendentes((self._segmento, self._tamanho)), None) is not None
+            self._aberto = True
+            print(f"📒 Diário aberto em {self.diretorio} (segmento {self._segmento}, "
+                  f"{'com' if self._pendente else 'sem'} registos por enviar).")
+
+        thread = threading.Thread(target=self._ciclo_reenvio, name="diario-reenvio")
+        thread.daemon = True
+        thread.start()
+
+    def fechar(self):
+        with self._lock:
+            if not self._aberto:
+                return
+            self._aberto = False
+            if self.fsync != FSYNC_NUNCA:
+                self._sincronizar()
+            self._ficheiro.close()
+            self._bloqueio.close()
+
+    # --- Escrita ---
+    def registar(self, registo, enfileirar):
+        # Acrescenta o registo (caminho, dados) ao diário e entrega (posição,
+        # registo) a `enfileirar`. Devolve False só se o registo não ficou nem no
+        # diário nem na fila. Corre sob o lock para que a ordem na fila seja a do diário.
+        with self._lock:
+            if not self._aberto:
+                return enfileirar((None, registo))
+            inicio = time.perf_counter()
+            dados = json.dumps(registo, separators=(",", ":")).encode("utf-8")
+            self._ficheiro.write(CABECALHO.pack(len(dados), zlib.crc32(dados)) + dados)
+            self._ficheiro.flush()
+            self._tamanho += CABECALHO.size + len(dados)
+            posicao = (self._segmento, self._tamanho)
+            if self.fsync == FSYNC_SEMPRE or (
+                    self.fsync == FSYNC_INTERVALO and time.monotonic() - self._ultimo_fsync >= self.intervalo_fsync):
+                self._sincronizar()
+            if self._tamanho >= self.tamanho_segmento:
+                if self.fsync != FSYNC_NUNCA:
+                    self._sincronizar()
+                self._ficheiro.close()
+                self._abrir_segmento(self._segmento + 1)
+            self.acrescentados += 1
+            self.tempo_acrescentar += time.perf_counter() - inicio
+
+            if not enfileirar((posicao, registo)):
+                # Fila cheia: o registo fica no diário e segue pelo reenvio
+                self.fora_da_fila += 1
+                self._pendente = True
+            return True
+
+    def escrever_lote(self, lote):
+        # Escritor da fila: `lote` é uma lista de (posição, registo)
+        posicoes = [posicao for posicao, _ in lote if posicao is not None]
+        with self._lock_envio:
+            if posicoes and self._pendente:
+                # Há registos anteriores por enviar: o reenvio inclui os registos
+                # deste lote que estão no diário; os restantes (enfileirados com o
+                # diário fechado) são escritos já, antes do reenvio, para que uma
+                # falha no reenvio não os perca
+                sem_diario = [registo for posicao, registo in lote if posicao is None]
+                if sem_diario:
+                    self._escrever(sem_diario)
+                self._reenviar()
+                return
+            try:
+                self._escrever([registo for _, registo in lote])
+            except Exception:
+                if posicoes:
+                    self._pendente = True
+                raise
+            if posicoes:
+                self._confirmar(max(posicoes), len(posicoes))
+
+    def _confirmar(self, posicao, registos):
+        # Chamado com _lock_envio adquirido. Com o diário fechado (liderança
+        # perdida) o diretório pode já ser de outro processo: não se confirma
+        # nada e o reenvio do novo dono cobre estas posições. Corre sob o lock
+        # para que `fechar` não aconteça a meio.
+        with self._lock:
+            if not self._aberto or posicao <= self._confirmado:
+                return
+            self._confirmado = posicao
+            self.confirmados += registos
+            temporario = os.path.join(self.diretorio, f"{FICHEIRO_CONFIRMADO}.tmp")
+            with open(temporario, "w") as ficheiro:
+                ficheiro.write(f"{posicao[0]} {posicao[1]}")
+            os.replace(temporario, os.path.join(self.diretorio, FICHEIRO_CONFIRMADO))
+            # Segmentos anteriores ao confirmado já não são precisos
+            for numero in self._segmentos():
+                if numero < posicao[0] and numero != self._segmento:
+                    os.remove(self._caminho_segmento(numero))
+
+    # --- Reenvio ---
+    def _reenviar(self):
+        # Chamado com _lock_envio adquirido: envia, em lotes, tudo o que está
+        # entre a posição confirmada e o fim atual do diário
+        with self._lock:
+            fim = (self._segmento, self._tamanho)
+            self._pendente = False
+        try:
+            lote = []
+            for posicao, registo in self._pendentes(fim):
+                lote.append((posicao, registo))
+                if len(lote) >= self.tamanho_lote:
+                    self._enviar_reenvio(lote)
+                    lote = []
+            if lote:
+                self._enviar_reenvio(lote)
+            # Registos corrompidos que não puderam ser lidos também ficam para trás
+            self._confirmar(fim, 0)
+        except Exception:
+            self._pendente = True
+            raise
+
+    def _pendentes(self, fim):
+        # Registos entre a posição confirmada e `fim`
+        for numero in self._segmentos():
+            if self._confirmado[0] <= numero <= fim[0]:
+                inicio = self._confirmado[1] if numero == self._confirmado[0] else 0
+                yield from self._ler_segmento(numero, inicio, fim[1] if numero == fim[0] else None)
+
+    def _enviar_reenvio(self, lote):
+        self._escrever([registo for _, registo in lote])
+        self.reenviados += len(lote)
+        self._confirmar(lote[-1][0], len(lote))
+
+    def _ciclo_reenvio(self):
+        while self._aberto:
+            if self._pendente:
+                try:
+                    with self._lock_envio:
+                        if self._pendente:
+                            self._reenviar()
+                            print("📒 Registos pendentes do diário reenviados.")
+                except Exception as e:
+                    print(f"❌ Erro ao reenviar registos do diário: {e}")
+            time.sleep(self.intervalo_reenvio)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "aberto": self._aberto,
+                "fsync": self.fsync,
+                "segmento": self._segmento,
+                "posicao": self._tamanho,
+                "confirmado": list(self._confirmado),
+                "pendente": self._pendente,
+                "acrescentados": self.acrescentados,
+                "confirmados": self.confirmados,
+                "reenviados": self.reenviados,
+                "fora_da_fila": self.fora_da_fila,
+                "fsyncs": self.fsyncs,
+                "acrescentar_us": round(self.tempo_acrescentar / self.acrescentados * 1e6, 1)
+                if self.acrescentados else None,
+            }
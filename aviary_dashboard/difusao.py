@@ -0,0 +1,342 @@
+import threading
+import time
+
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+EVENTO_SNAPSHOT = 'new_sensor_data'
+EVENTO_DELTA = 'sensor_delta'
+
+# Campos de contexto: acompanham sempre os campos subscritos, mas sozinhos não
+# geram um delta
+CAMPOS_CONTEXTO = frozenset(["timestamp"])
+
+# Espera mínima antes de voltar a tentar um cliente com a fila de saída cheia
+ESPERA_LENTO_S = 0.1
+
+_AUSENTE = object()
+
+
+class _Cliente:
+    __slots__ = ("seq", "ultimo_envio", "agendado", "campos")
+
+    def __init__(self, seq, campos=None):
+        self.seq = seq                # Última sequência enviada a este cliente
+        self.ultimo_envio = 0.0
+        self.agendado = False         # Já existe um envio diferido pendente
+        self.campos = campos          # Campos subscritos (None = todos)
+
+    def interessado(self, campos):
+        return self.campos is None or not self.campos.isdisjoint(campos)
+
+
+# Difusão do estado para os browsers com protocolo de deltas: cada alteração
+# recebe um número de sequência crescente; os clientes recebem o snapshot
+# completo ao ligar e depois apenas os campos alterados. Um delta indica a
+# sequência em que se baseia (`base`), pelo que o cliente deteta falhas e
+# pede um novo snapshot.
+#
+# Cada cliente recebe no máximo `max_hz` deltas por segundo. Entre envios as
+# alterações não são acumuladas em frames: guarda-se apenas a sequência em que
+# cada campo mudou, e o delta seguinte leva o valor mais recente de todos os
+# campos alterados desde a última sequência enviada ao cliente. Alterações em
+# `campos_prioritarios` (ex.: alarme de gás) ignoram o limite de frequência,
+# mas nunca se juntam a mais de `max_pendentes` pacotes na fila de um cliente
+# lento: seguem no envio diferido, já com o valor mais recente.
+#
+# Um cliente pode subscrever apenas alguns campos (ex.: um painel de alarme só
+# com `gas`): recebe snapshots e deltas só com esses campos (e os de contexto)
+# e nada quando nenhum deles muda. A sequência continua a ser a do difusor, por
+# isso os deltas de um cliente seletivo saltam números mas `base` mantém-se
+# coerente.
+#
+# Com `sala`, os clientes registados entram numa sala Socket.IO por conjunto de
+# campos subscritos (a `sala` para os que subscrevem tudo, ex.: a do seu
+# aviário) e, quando todos os clientes de uma sala recebem o mesmo delta, é
+# feito um único emit para essa sala em vez de um por cliente.
+#
+# Cada snapshot e cada delta é serializado uma única vez num pacote Engine.IO
+# (que guarda o próprio texto codificado) e os mesmos bytes são reutilizados
+# para todos os destinatários, incluindo clientes que ligam ou pedem resync
+# mais tarde, até a sequência mudar. O conteúdo de um pacote depende apenas de
+# (evento, base, seq, campos subscritos), que é a chave da cache. Com um
+# serializador binário (msgpack) há dois pacotes por entrada: os bytes para
+# WebSocket e a versão base64 que o long-polling exige.
+class Difusor:
+    def __init__(self, socketio, estado_inicial, max_hz=0, campos_prioritarios=(), max_pendentes=8, sala=None):
+        self._socketio = socketio
+        self.sala = sala
+        self._lock = threading.Lock()
+        self._estado = dict(estado_inicial)
+        self._seq_campo = {campo: 0 for campo in estado_inicial}
+        self._clientes = {}
+        self._grupos = {}  # campos subscritos -> sids
+        self.seq = 0
+        self.intervalo = 1.0 / max_hz if max_hz > 0 else 0.0
+        self.campos_prioritarios = frozenset(campos_prioritarios)
+        self.max_pendentes = max_pendentes
+        self.deltas = 0
+        self.snapshots = 0
+        self.envios = 0
+        self.prioritarios = 0
+        self.adiados = 0
+        self.difundidos = 0
+        self.filtrados = 0
+        self._pacotes = {}  # (evento, base, campos) -> (pacote WebSocket, pacote polling) da sequência atual
+        self.codificacoes = 0
+        self.reutilizacoes = 0
+
+    # --- Clientes ---
+    # registar_cliente, subscrever e reenviar_snapshot enviam o snapshot ao
+    # cliente ainda com o lock adquirido, para que chegue antes de qualquer
+    # delta calculado a seguir; devolvem o snapshot enviado.
+    def registar_cliente(self, sid, campos=None):
+        # `campos`: conjunto de campos subscritos (None = todos)
+        with self._lock:
+            cliente = _Cliente(self.seq, frozenset(campos) if campos is not None else None)
+            self._clientes[sid] = cliente
+            self._entrar_grupo(sid, cliente.campos)
+            return self._enviar_snapshot(sid, cliente.campos)
+
+    def remover_cliente(self, sid):
+        with self._lock:
+            cliente = self._clientes.pop(sid, None)
+            if cliente is not None:
+                self._sair_grupo(sid, cliente.campos)
+
+    def subscrever(self, sid, campos=None):
+        # Muda os campos subscritos por um cliente já registado e devolve o
+        # snapshot correspondente (None se o cliente não estiver registado)
+        with self._lock:
+            cliente = self._clientes.get(sid)
+            if cliente is None:
+                return None
+            self._sair_grupo(sid, cliente.campos)
+            cliente.campos = frozenset(campos) if campos is not None else None
+            cliente.seq = self.seq
+            self._entrar_grupo(sid, cliente.campos)
+            return self._enviar_snapshot(sid, cliente.campos)
+
+    def reenviar_snapshot(self, sid):
+        with self._lock:
+            cliente = self._clientes.get(sid)
+            if cliente is None:
+                return None
+            cliente.seq = self.seq
+            return self._enviar_snapshot(sid, cliente.campos)
+
+    def _snapshot(self, campos=None):
+        if campos is None:
+            return dict(self._estado, seq=self.seq)
+        dados = {campo: valor for campo, valor in self._estado.items()
+                 if campo in campos or campo in CAMPOS_CONTEXTO}
+        dados["seq"] = self.seq
+        return dados
+
+    def _enviar_snapshot(self, sid, campos):
+        # Chamado com o lock adquirido
+        self.snapshots += 1
+        dados = self._snapshot(campos)
+        self._transmitir(self._pacote(EVENTO_SNAPSHOT, None, campos, dados), sid=sid)
+        return dados
+
+    # --- Salas ---
+    def _sala_grupo(self, campos):
+        if campos is None:
+            return self.sala
+        return f"{self.sala}|{','.join(sorted(campos))}"
+
+    def _entrar_grupo(self, sid, campos):
+        # Chamado com o lock adquirido, para que os membros de cada sala
+        # coincidam com os clientes registados quando se decide difundir
+        self._grupos.setdefault(campos, set()).add(sid)
+        if self.sala is not None:
+            self._socketio.server.enter_room(sid, self._sala_grupo(campos), namespace='/')
+
+    def _sair_grupo(self, sid, campos):
+        # Chamado com o lock adquirido
+        membros = self._grupos.get(campos)
+        if membros is not None:
+            membros.discard(sid)
+            if not membros:
+                del self._grupos[campos]
+        if self.sala is not None:
+            self._socketio.server.leave_room(sid, self._sala_grupo(campos), namespace='/')
+
+    # --- Publicação ---
+    def publicar(self, snapshot):
+        envios = []
+        with self._lock:
+            alteracoes = {campo: valor for campo, valor in snapshot.items()
+                          if self._estado.get(campo, _AUSENTE) != valor}
+            if not alteracoes:
+                return None
+            self.seq += 1
+            self._pacotes.clear()
+            self._estado.update(alteracoes)
+            for campo in alteracoes:
+                self._seq_campo[campo] = self.seq
+            self.deltas += 1
+
+            prioritarios = self.campos_prioritarios.intersection(alteracoes)
+            if prioritarios:
+                self.prioritarios += 1
+            agora = time.monotonic()
+            por_grupo = {}
+            grupos_adiados = set()
+            for sid, cliente in self._clientes.items():
+                if not cliente.interessado(alteracoes):
+                    self.filtrados += 1
+                    continue
+                livre = agora - cliente.ultimo_envio >= self.intervalo \
+                    or (prioritarios and cliente.interessado(prioritarios))
+                lento = livre and self._pendentes(sid) >= self.max_pendentes
+                if livre and not lento:
+                    por_grupo.setdefault(cliente.campos, []).append((sid, self._delta_para(cliente, agora)))
+                else:
+                    self._agendar(sid, cliente, agora, lento)
+                    grupos_adiados.add(cliente.campos)
+            for campos, envios_grupo in por_grupo.items():
+                if self.sala is not None and campos not in grupos_adiados \
+                        and len({pacote for _, pacote in envios_grupo}) == 1:
+                    # Todos os clientes da sala recebem o mesmo delta
+                    envios.append((None, self._sala_grupo(campos), envios_grupo[0][1]))
+                    self.difundidos += 1
+                else:
+                    envios.extend((sid, None, pacote) for sid, pacote in envios_grupo)
+        for sid, sala, pacote in envios:
+            self._enviar(pacote, sid=sid, sala=sala)
+        return alteracoes
+
+    def preencher(self, valores):
+        # Publica só os campos ainda nunca publicados: valores que chegam
+        # atrasados (ex.: estado hidratado) não se sobrepõem a dados recentes
+        with self._lock:
+            valores = {campo: valor for campo, valor in valores.items() if self._seq_campo.get(campo, 0) == 0}
+        return self.publicar(valores) if valores else None
+
+    def _delta_para(self, cliente, agora):
+        # Chamado com o lock adquirido. Devolve o pacote (partilhado por todos os
+        # clientes com a mesma base e campos) ou None se nada do que o cliente
+        # subscreveu mudou
+        chave = (EVENTO_DELTA, cliente.seq, cliente.campos)
+        pacote = self._pacotes.get(chave)
+        if pacote is None:
+            alterados = [campo for campo, seq in self._seq_campo.items() if seq > cliente.seq]
+            if cliente.campos is not None:
+                if cliente.campos.isdisjoint(alterados):
+                    return None
+                alterados = [campo for campo in alterados if campo in cliente.campos or campo in CAMPOS_CONTEXTO]
+            delta = {"seq": self.seq, "base": cliente.seq, "dados": {campo: self._estado[campo] for campo in alterados}}
+            pacote = self._pacote(EVENTO_DELTA, cliente.seq, cliente.campos, delta)
+        else:
+            self.reutilizacoes += 1
+        cliente.seq = self.seq
+        cliente.ultimo_envio = agora
+        return pacote
+
+    def _pacote(self, evento, base, campos, dados):
+        # Chamado com o lock adquirido
+        chave = (evento, base, campos)
+        pacote = self._pacotes.get(chave)
+        if pacote is not None:
+            self.reutilizacoes += 1
+            return pacote
+        codificado = self._socketio.server.packet_class(
+            sio_packet.EVENT, namespace='/', data=[evento, dados]).encode()
+        # O pacote Engine.IO guarda a codificação final para todos os envios; a
+        # de um pacote binário depende do transporte, por isso há uma cópia por
+        # transporte (o mesmo pacote serve os dois quando é texto)
+        websocket = eio_packet.Packet(eio_packet.MESSAGE, codificado)
+        websocket.encode()
+        polling = websocket
+        if websocket.binary:
+            polling = eio_packet.Packet(eio_packet.MESSAGE, codificado)
+            polling.encode(b64=True)
+        pacote = (websocket, polling)
+        self._pacotes[chave] = pacote
+        self.codificacoes += 1
+        return pacote
+
+    def _agendar(self, sid, cliente, agora, lento=False):
+        # Chamado com o lock adquirido; no máximo um envio diferido por cliente.
+        # Um cliente `lento` (fila cheia) volta a ser tentado só após ESPERA_LENTO_S
+        self.adiados += 1
+        if cliente.agendado:
+            return
+        cliente.agendado = True
+        atraso = max(self.intervalo - (agora - cliente.ultimo_envio), ESPERA_LENTO_S if lento else 0.0)
+        self._socketio.start_background_task(self._enviar_diferido, sid, atraso)
+
+    def _enviar_diferido(self, sid, atraso):
+        self._socketio.sleep(atraso)
+        with self._lock:
+            cliente = self._clientes.get(sid)
+            if cliente is None:
+                return
+            cliente.agendado = False
+            if cliente.seq == self.seq:
+                return  # Já recebeu tudo (ex.: por um envio prioritário)
+            agora = time.monotonic()
+            if self._pendentes(sid) >= self.max_pendentes:
+                # Cliente lento: não se empilham mais frames, tenta-se mais tarde
+                self._agendar(sid, cliente, agora, lento=True)
+                return
+            pacote = self._delta_para(cliente, agora)
+        if pacote is not None:
+            self._enviar(pacote, sid=sid)
+
+    def _pendentes(self, sid):
+        # Pacotes ainda na fila de saída do Engine.IO para este cliente
+        try:
+            servidor = self._socketio.server
+            eio_sid = servidor.manager.eio_sid_from_sid(sid, '/')
+            return servidor.eio._get_socket(eio_sid).queue.qsize()
+        except Exception:
+            return 0
+
+    def _transmitir(self, pacote, sid=None, sala=None):
+        # Entrega o pacote já codificado ao cliente `sid` ou a todos os membros
+        # da `sala`, sem voltar a serializar
+        servidor = self._socketio.server
+        if sala is not None:
+            destinos = [eio_sid for _, eio_sid in servidor.manager.get_participants('/', sala)]
+        else:
+            destinos = [servidor.manager.eio_sid_from_sid(sid, '/')]
+        websocket, polling = pacote
+        for eio_sid in destinos:
+            if eio_sid is None:
+                continue
+            if websocket is not polling:
+                try:
+                    # Na passagem a WebSocket os pacotes em fila seguem pelo
+                    # WebSocket, que também aceita a versão base64
+                    upgraded = servidor.eio._get_socket(eio_sid).upgraded
+                except KeyError:
+                    continue  # Cliente já desligado
+                servidor._send_eio_packet(eio_sid, websocket if upgraded else polling)
+            else:
+                servidor._send_eio_packet(eio_sid, websocket)
+
+    def _enviar(self, pacote, sid=None, sala=None):
+        self._transmitir(pacote, sid=sid, sala=sala)
+        with self._lock:
+            self.envios += 1
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "seq": self.seq,
+                "clientes": len(self._clientes),
+                "grupos": len(self._grupos),
+                "max_hz": round(1.0 / self.intervalo, 2) if self.intervalo else 0,
+                "deltas": self.deltas,
+                "snapshots": self.snapshots,
+                "envios": self.envios,
+                "prioritarios": self.prioritarios,
+                "adiados": self.adiados,
+                "difundidos": self.difundidos,
+                "filtrados": self.filtrados,
+                "codificacoes": self.codificacoes,
+                "reutilizacoes": self.reutilizacoes,
+            }
@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+
+# Políticas quando a fila está cheia
+POLITICA_DESCARTAR = "descartar"  # Rejeita o registo novo e contabiliza-o como descartado
+POLITICA_BLOQUEAR = "bloquear"    # Bloqueia quem enfileira até haver espaço (ou até ao timeout)
+POLITICAS = (POLITICA_DESCARTAR, POLITICA_BLOQUEAR)
+
+
+# Fila limitada de escrita diferida (write-behind): a callback MQTT apenas
+# enfileira e uma thread dedicada escoa a fila em lotes e chama o `escritor`
+# com a lista de registos, pelo que a latência do Firebase deixa de travar a
+# leitura de mensagens do broker. Um lote fecha ao atingir `tamanho_lote`
+# registos ou ao fim de `intervalo_lote` segundos desde o primeiro registo.
+class FilaEscrita:
+    def __init__(self, escritor, max_profundidade=1000, politica=POLITICA_DESCARTAR, timeout_bloqueio=None,
+                 tamanho_lote=1, intervalo_lote=0.0):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de fila desconhecida: {politica}")
+        self._escritor = escritor
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.intervalo_lote = intervalo_lote
+        self._fila = queue.Queue(maxsize=max_profundidade)
+        self.max_profundidade = max_profundidade
+        self.politica = politica
+        self.timeout_bloqueio = timeout_bloqueio
+        self._lock = threading.Lock()
+        self._thread = None
+        self.enfileirados = 0
+        self.escritos = 0
+        self.descartados = 0
+        self.falhados = 0
+        self.lotes = 0
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._escoar, name="fila-escrita")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def enfileirar(self, dados):
+        try:
+            if self.politica == POLITICA_BLOQUEAR:
+                self._fila.put(dados, timeout=self.timeout_bloqueio)
+            else:
+                self._fila.put_nowait(dados)
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+            return False
+        with self._lock:
+            self.enfileirados += 1
+        return True
+
+    def _recolher_lote(self):
+        lote = [self._fila.get()]
+        prazo = time.monotonic() + self.intervalo_lote
+        while len(lote) < self.tamanho_lote:
+            restante = prazo - time.monotonic()
+            try:
+                # Depois do prazo ainda aproveita o que já está na fila, sem esperar
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _escoar(self):
+        while True:
+            lote = self._recolher_lote()
+            try:
+                self._escritor(lote)
+                with self._lock:
+                    self.escritos += len(lote)
+                    self.lotes += 1
+            except Exception as e:
+                with self._lock:
+                    self.falhados += len(lote)
+                print(f"❌ Erro ao escrever lote de {len(lote)} registo(s) da fila: {e}")
+            finally:
+                for _ in lote:
+                    self._fila.task_done()
+
+    def drenar(self, timeout):
+        # Espera no máximo `timeout` segundos que todos os registos enfileirados
+        # sejam escritos (ex.: ao terminar o processo); devolve True se conseguiu
+        prazo = time.monotonic() + timeout
+        with self._fila.all_tasks_done:
+            while self._fila.unfinished_tasks:
+                restante = prazo - time.monotonic()
+                if restante <= 0 or self._thread is None:
+                    return False
+                self._fila.all_tasks_done.wait(restante)
+        return True
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "profundidade": self._fila.qsize(),
+                "max_profundidade": self.max_profundidade,
+                "politica": self.politica,
+                "tamanho_lote": self.tamanho_lote,
+                "intervalo_lote_ms": int(self.intervalo_lote * 1000),
+                "enfileirados": self.enfileirados,
+                "escritos": self.escritos,
+                "descartados": self.descartados,
+                "falhados": self.falhados,
+                "lotes": self.lotes,
+            }
@@ -1,22 +1,109 @@
-import firebase_admin 
-from firebase_admin import credentials, db
 from datetime import datetime
+import os
+import threading
+import time
 import uuid
 
-cred = credentials.Certificate("aviario-cloud-firebase-adminsdk-fbsvc-8c884a6463.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://aviario-cloud-default-rtdb.europe-west1.firebasedatabase.app/'
-})
+FIREBASE_CREDENCIAIS = os.getenv("FIREBASE_CREDENCIAIS", "aviario-cloud-firebase-adminsdk-fbsvc-8c884a6463.json")
+FIREBASE_URL = os.getenv("FIREBASE_URL", "https://aviario-cloud-default-rtdb.europe-west1.firebasedatabase.app/")
 
-def ler_dados_aviario():
-    ref = db.reference('aviario/sensores')
-    return ref.get()
+CAMINHO_RAIZ = "aviario"
+CAMINHO_LIDER = "aviario/lider"
 
-def guardar_dados_em_firebase(dados):
-    ref = db.reference('aviario/sensores')
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = f"{timestamp}_{uuid.uuid4().hex[:6]}"
+# A aplicação Firebase só é inicializada no primeiro acesso, e não ao importar
+# o módulo: com um backend de histórico local o processo arranca sem
+# credenciais nem rede. O próprio firebase_admin (google-auth, cryptography,
+# ...) também só é importado aqui, fora do caminho crítico do arranque. A
+# referência raiz é criada uma única vez e reutilizada em todas as escritas.
+_lock_inicio = threading.Lock()
+db = None
+ref_raiz = None
 
-    ref = db.reference("aviario/historico")
-    ref.child(unique_id).set(dados)
-    ref.push(dados)
\ No newline at end of file
+def iniciar_firebase():
+    global db, ref_raiz
+    with _lock_inicio:
+        if ref_raiz is None:
+            import firebase_admin
+            from firebase_admin import credentials, db
+            cred = credentials.Certificate(FIREBASE_CREDENCIAIS)
+            firebase_admin.initialize_app(cred, {'databaseURL': FIREBASE_URL})
+            ref_raiz = db.reference(CAMINHO_RAIZ)
+
+def _raiz():
+    if ref_raiz is None:
+        iniciar_firebase()
+    return ref_raiz
+
+def _referencia(caminho):
+    _raiz()
+    return db.reference(caminho)
+
+def gerar_chave_historico(instante=None):
+    # Chave ordenável cronologicamente (até ao microssegundo) com sufixo aleatório anti-colisão
+    timestamp = (instante or datetime.now()).strftime("%Y%m%d_%H%M%S_%f")
+    return f"{timestamp}_{uuid.uuid4().hex[:4]}"
+
+# Caminhos relativos a CAMINHO_RAIZ, usados nos lotes de escrita. O aviário
+# por omissão (local None) mantém os caminhos originais; os restantes ficam
+# em aviario/sites/<local>/...
+def _prefixo_local(local):
+    return f"sites/{local}/" if local else ""
+
+# Série: caminho do nó cujos filhos são os registos, ordenados pela chave
+def serie_historico(local=None):
+    return f"{_prefixo_local(local)}historico"
+
+def serie_agregados(resolucao, local=None):
+    return f"{_prefixo_local(local)}agregados/{resolucao}"
+
+def caminho_historico(chave, local=None):
+    return f"{serie_historico(local)}/{chave}"
+
+def caminho_agregado(resolucao, chave, local=None):
+    return f"{serie_agregados(resolucao, local)}/{chave}"
+
+def guardar_lote_em_firebase(registos):
+    # Um único pedido multi-caminho para todo o lote de (caminho, dados); cada
+    # registo é escrito uma só vez
+    if registos:
+        _raiz().update({caminho: dados for caminho, dados in registos})
+
+def ler_intervalo(serie, inicio, fim, n):
+    # Devolve os últimos `n` registos da série com chave em [inicio, fim]
+    # (limites opcionais) como lista de (chave, dados) em ordem cronológica
+    consulta = _raiz().child(serie).order_by_key()
+    if inicio is not None:
+        consulta = consulta.start_at(inicio)
+    if fim is not None:
+        consulta = consulta.end_at(fim)
+    dados = consulta.limit_to_last(n).get()
+    if not isinstance(dados, dict):
+        return []
+    return sorted(dados.items(), key=lambda x: x[0])
+
+def listar_locais():
+    # Aviários com caminhos próprios (aviario/sites/<local>); só lê as chaves
+    locais = _raiz().child("sites").get(shallow=True)
+    return sorted(locais) if isinstance(locais, dict) else []
+
+# --- Lease de Liderança da Ingestão ---
+def disputar_lease_lider(identificador, ttl):
+    # Assume (ou renova) o lease se estiver livre, expirado ou já for nosso
+    agora = time.time()
+
+    def atualizar(atual):
+        if isinstance(atual, dict) and atual.get("id") != identificador and atual.get("expira", 0) > agora:
+            return atual
+        return {"id": identificador, "expira": agora + ttl}
+
+    resultado = _referencia(CAMINHO_LIDER).transaction(atualizar)
+    return isinstance(resultado, dict) and resultado.get("id") == identificador
+
+def libertar_lease_lider(identificador):
+    # Liberta o lease ao terminar, para que outro processo assuma sem esperar pelo ttl
+    def atualizar(atual):
+        if isinstance(atual, dict) and atual.get("id") == identificador:
+            return None
+        return atual
+
+    _referencia(CAMINHO_LIDER).transaction(atualizar)
@@ -1,5 +1,9 @@
 # gunicorn.conf.py
+import os
+
 worker_class = 'eventlet'
-workers = 1 # Para o App Engine Standard, um worker por instância é geralmente o ideal.
+# Um worker por instância no papel "completo" (cada worker teria o seu próprio cliente MQTT).
+# Com AVIARIO_PAPEL=web e um barramento partilhado podem usar-se vários workers.
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
 bind = '0.0.0.0:8080' # Garante que o Gunicorn ouve na porta correta para o App Engine.
 timeout = 120 # Aumenta o tempo limite para as ligações de longa duração do Socket.IO.
\ No newline at end of file
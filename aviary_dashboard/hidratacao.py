@@ -0,0 +1,58 @@
+import json
+import os
+import threading
+import time
+
+
+# Estado de um aviário a partir dos últimos registos do histórico (lista de
+# (chave, dados) em ordem cronológica): cada campo fica com o valor mais recente
+# que não esteja em falta, o que também cobre registos parciais (subscrições
+# partilhadas). Devolve {} se não houver registos.
+def estado_de_registos(registos, campos):
+    estado = {}
+    for _, dados in reversed(registos):
+        if not isinstance(dados, dict):
+            continue
+        for campo in campos:
+            if campo not in estado and dados.get(campo) is not None:
+                estado[campo] = dados[campo]
+        if len(estado) == len(campos):
+            break
+    return estado
+
+
+# Ficheiro local com o estado de todos os aviários ({local: estado}); um
+# ficheiro inexistente equivale a não haver estado guardado.
+def ler_ficheiro_estado(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as ficheiro:
+            estados = json.load(ficheiro)
+    except FileNotFoundError:
+        return {}
+    return {local: estado for local, estado in estados.items() if isinstance(estado, dict)}
+
+
+# Grava o estado no ficheiro no máximo uma vez a cada `intervalo` segundos
+# (escrita atómica: ficheiro temporário + rename), para que um reinício
+# recupere o último estado sem ler o Firebase.
+class GravadorEstado:
+    def __init__(self, caminho, intervalo=5.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._ultima = 0.0
+        self.gravacoes = 0
+
+    def gravar(self, obter_estados, forcar=False):
+        # `obter_estados` só é chamado quando a gravação avança
+        with self._lock:
+            agora = time.monotonic()
+            if not forcar and agora - self._ultima < self.intervalo:
+                return False
+            self._ultima = agora
+            temporario = f"{self.caminho}.tmp"
+            with open(temporario, "w", encoding="utf-8") as ficheiro:
+                json.dump(obter_estados(), ficheiro)
+            os.replace(temporario, self.caminho)
+            self.gravacoes += 1
+            return True
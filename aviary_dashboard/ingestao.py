@@ -0,0 +1,13 @@
+# Processo dedicado de ingestão: liga ao broker MQTT, persiste no Firebase e
+# publica os snapshots no barramento (BARRAMENTO_URL) para os workers web
+# (AVIARIO_PAPEL=web). Uso: BARRAMENTO_URL=redis://... python ingestao.py
+import os
+import threading
+
+os.environ.setdefault("AVIARIO_PAPEL", "ingestao")
+
+import app
+
+if __name__ == '__main__':
+    # A ingestão corre em threads daemon (podendo aguardar a eleição de líder)
+    threading.Event().wait()
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+
+# Lock de ficheiro (flock) partilhado pelos workers da mesma máquina/instância.
+# O sistema operativo liberta o lock quando o processo líder termina, pelo que
+# um seguidor assume no ciclo seguinte.
+class LiderancaFicheiro:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._ficheiro = None
+
+    def disputar(self):
+        if self._ficheiro is not None:
+            return True
+        import fcntl
+        ficheiro = open(self.caminho, "a+")
+        try:
+            fcntl.flock(ficheiro, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            ficheiro.close()
+            return False
+        ficheiro.seek(0)
+        ficheiro.truncate()
+        ficheiro.write(str(os.getpid()))
+        ficheiro.flush()
+        self._ficheiro = ficheiro
+        return True
+
+    def libertar(self):
+        if self._ficheiro is not None:
+            self._ficheiro.close()
+            self._ficheiro = None
+
+
+# Lease no Firebase partilhado por todas as instâncias: `disputar` e
+# `libertar` são funções (identificador, ttl) -> bool / (identificador) -> None
+# que atualizam o lease numa transação (ver firebase.py).
+class LiderancaLease:
+    def __init__(self, disputar, libertar, identificador, ttl=15.0):
+        self._disputar = disputar
+        self._libertar = libertar
+        self.identificador = identificador
+        self.ttl = ttl
+
+    def disputar(self):
+        return self._disputar(self.identificador, self.ttl)
+
+    def libertar(self):
+        self._libertar(self.identificador)
+
+
+# Eleição de um único processo de ingestão entre workers/instâncias: a cada
+# `intervalo` segundos disputa a liderança e chama `ao_assumir` ou `ao_perder`
+# nas transições. O tempo de failover fica limitado a `intervalo` (lock de
+# ficheiro) ou ao ttl do lease mais `intervalo` (Firebase).
+class Eleicao:
+    def __init__(self, estrategia, ao_assumir, ao_perder, intervalo=5.0):
+        self._estrategia = estrategia
+        self._ao_assumir = ao_assumir
+        self._ao_perder = ao_perder
+        self.intervalo = intervalo
+        self.lider = False
+        self.transicoes = 0
+        self.desde = None
+        self._thread = None
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._ciclo, name="eleicao-lider")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _ciclo(self):
+        while True:
+            try:
+                eleito = self._estrategia.disputar()
+            except Exception as e:
+                # Sem confirmar o lease não se pode continuar a ingerir
+                print(f"❌ Erro na eleição de líder: {e}")
+                eleito = False
+            if eleito != self.lider:
+                self.lider = eleito
+                self.transicoes += 1
+                self.desde = time.time()
+                try:
+                    (self._ao_assumir if eleito else self._ao_perder)()
+                except Exception as e:
+                    print(f"❌ Erro na transição de liderança: {e}")
+            time.sleep(self.intervalo)
+
+    def libertar(self):
+        if self.lider:
+            try:
+                self._estrategia.libertar()
+            except Exception as e:
+                print(f"❌ Erro ao libertar liderança: {e}")
+
+    def metricas(self):
+        return {
+            "lider": self.lider,
+            "transicoes": self.transicoes,
+            "desde": self.desde,
+            "intervalo_s": self.intervalo,
+        }
@@ -0,0 +1,84 @@
+import re
+import threading
+
+# Identificador de aviário usado nos tópicos (aviario/<local>/<sensor>), nas
+# salas Socket.IO e nos caminhos do Firebase: só caracteres seguros em todos.
+_RE_LOCAL = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+
+def local_valido(identificador):
+    return isinstance(identificador, str) and _RE_LOCAL.fullmatch(identificador) is not None
+
+
+def sala_local(identificador):
+    return f"local:{identificador}"
+
+
+# Estado e componentes de um aviário (difusor, cache, agregador, coalescedor),
+# preenchidos pela fábrica passada ao RegistoLocais.
+class Local:
+    def __init__(self, identificador, estado):
+        self.identificador = identificador
+        self.estado = estado
+        self.campos_recebidos = set()  # Todos os campos já recebidos por MQTT
+        self._campos_ciclo = set()     # Campos recebidos no ciclo de coalescência atual
+        self._lock = threading.Lock()
+        self.difusor = None
+        self.cache = None
+        self.agregador = None
+        self.coalescedor = None
+
+    def registar_campo(self, campo):
+        with self._lock:
+            self.campos_recebidos.add(campo)
+            self._campos_ciclo.add(campo)
+
+    def fechar_ciclo(self):
+        # Devolve os campos recebidos desde o último snapshot e recomeça o ciclo
+        with self._lock:
+            campos, self._campos_ciclo = self._campos_ciclo, set()
+        return campos
+
+
+# Estado particionado por aviário: cada local é criado na primeira mensagem (ou
+# ligação) que o refere. `maximo` limita o número de locais, para que tópicos
+# com identificadores arbitrários não esgotem a memória; `permitidos`, se não
+# vazio, restringe os identificadores aceites.
+class RegistoLocais:
+    def __init__(self, fabrica, maximo=100, permitidos=()):
+        self._fabrica = fabrica
+        self.maximo = maximo
+        self.permitidos = frozenset(permitidos)
+        self._locais = {}
+        self._lock = threading.Lock()
+        self.rejeitados = 0
+
+    def obter(self, identificador, criar=True):
+        # Devolve o local (ou None se não existir e não puder ser criado)
+        local = self._locais.get(identificador)
+        if local is not None or not criar:
+            return local
+        with self._lock:
+            local = self._locais.get(identificador)
+            if local is None:
+                if not local_valido(identificador) or len(self._locais) >= self.maximo \
+                        or (self.permitidos and identificador not in self.permitidos):
+                    self.rejeitados += 1
+                    return None
+                local = self._locais[identificador] = self._fabrica(identificador)
+        return local
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._locais.values()))
+
+    def __len__(self):
+        return len(self._locais)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "total": len(self._locais),
+                "maximo": self.maximo,
+                "rejeitados": self.rejeitados,
+            }
@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import deque
+
+TOPICO_OUTROS = "outros"
+
+
+# Contadores de mensagens MQTT recebidas por este processo, por tópico, e
+# débito (mensagens/s) numa janela deslizante de `janela` segundos. Com
+# subscrições partilhadas permite comparar a fatia tratada por cada worker.
+# Acima de `max_topicos` tópicos distintos as mensagens contam em "outros".
+class MetricasMqtt:
+    def __init__(self, janela=60, max_topicos=50):
+        self.janela = janela
+        self.max_topicos = max_topicos
+        self._lock = threading.Lock()
+        self._segundos = deque()  # [segundo, contagem], do mais antigo para o mais recente
+        self.recebidas = 0
+        self.rejeitadas = 0
+        self.por_topico = {}
+
+    def registar(self, topico, aceite=True):
+        agora = int(time.monotonic())
+        with self._lock:
+            self.recebidas += 1
+            if not aceite:
+                self.rejeitadas += 1
+            if topico not in self.por_topico and len(self.por_topico) >= self.max_topicos:
+                topico = TOPICO_OUTROS
+            self.por_topico[topico] = self.por_topico.get(topico, 0) + 1
+            if self._segundos and self._segundos[-1][0] == agora:
+                self._segundos[-1][1] += 1
+            else:
+                self._segundos.append([agora, 1])
+            self._descartar_antigos(agora)
+
+    def _descartar_antigos(self, agora):
+        while self._segundos and self._segundos[0][0] <= agora - self.janela:
+            self._segundos.popleft()
+
+    def metricas(self):
+        with self._lock:
+            self._descartar_antigos(int(time.monotonic()))
+            na_janela = sum(contagem for _, contagem in self._segundos)
+            return {
+                "recebidas": self.recebidas,
+                "rejeitadas": self.rejeitadas,
+                "por_topico": dict(self.por_topico),
+                "mensagens_por_segundo": round(na_janela / self.janela, 3),
+                "janela_s": self.janela,
+            }
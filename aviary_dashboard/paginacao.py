@@ -0,0 +1,40 @@
+import base64
+import re
+from datetime import datetime
+
+# Sufixo usado pelo Firebase para incluir todas as chaves com um dado prefixo em end_at()
+FIM_PREFIXO = "\uf8ff"
+
+_RE_PREFIXO_CHAVE = re.compile(r"[0-9_]+")
+_RE_CHAVE = re.compile(r"[0-9A-Za-z_-]+")
+
+# Converte um parâmetro from/to (prefixo de chave "AAAAMMDD[_HHMMSS]" ou data
+# ISO 8601) no limite correspondente sobre as chaves do histórico. Com `fim`
+# o limite inclui todas as chaves que começam pelo prefixo.
+def limite_de_parametro(valor, fim=False):
+    if not valor:
+        return None
+    if _RE_PREFIXO_CHAVE.fullmatch(valor):
+        prefixo = valor
+    else:
+        try:
+            prefixo = datetime.fromisoformat(valor).strftime("%Y%m%d_%H%M%S")
+        except ValueError:
+            raise ValueError(f"Data inválida: '{valor}'")
+    return prefixo + FIM_PREFIXO if fim else prefixo
+
+# O cursor é a chave do registo mais antigo da página, codificada de forma opaca;
+# a página seguinte contém os registos estritamente anteriores a essa chave.
+def codificar_cursor(chave):
+    return base64.urlsafe_b64encode(chave.encode("utf-8")).decode("ascii").rstrip("=")
+
+def descodificar_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        chave = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except ValueError:
+        raise ValueError("Cursor inválido")
+    if not _RE_CHAVE.fullmatch(chave):
+        raise ValueError("Cursor inválido")
+    return chave
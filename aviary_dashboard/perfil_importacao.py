@@ -0,0 +1,108 @@
+# Perfil das importações no arranque: importa a aplicação num processo novo
+# com `python -X importtime` e resume o custo de cada dependência direta de
+# app.py, os módulos mais lentos e os módulos cuja importação é diferida até ao
+# primeiro uso (paho-mqtt, firebase_admin, sqlite3), importados à parte no fim.
+# Também lê um registo já recolhido, por exemplo dos logs do App Engine com
+# PYTHONPROFILEIMPORTTIME=1 (aí as importações das threads de arranque podem
+# aparecer misturadas: a indentação do -X importtime não distingue threads).
+# Um módulo partilhado conta para a primeira dependência que o importou.
+# Uso: python perfil_importacao.py [registo] [--top N]
+import os
+import re
+import subprocess
+import sys
+
+MODULO = "app"
+DIFERIDOS = ("paho.mqtt.client", "firebase_admin.db", "sqlite3")
+# Configuração local e sem rede: nenhuma thread de arranque importa módulos em
+# paralelo com a aplicação (as importações ao nível do módulo não dependem dela)
+AMBIENTE_PERFIL = {
+    "AVIARIO_PAPEL": "web",
+    "BARRAMENTO_URL": "",
+    "HISTORICO_BACKEND": "memoria",
+    "HISTORICO_REPLICA": "nenhuma",
+    "HIDRATACAO_FONTE": "nenhuma",
+}
+FALHOU = "falhou: "
+LINHA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def recolher():
+    ambiente = dict(os.environ, **AMBIENTE_PERFIL)
+    # Uma importação diferida que falhe (ex.: dependência incompatível com o
+    # eventlet) fica registada em vez de interromper o perfil
+    codigo = f"import {MODULO}\n" + "".join(
+        f"try:\n    import {modulo}\nexcept Exception as e:\n"
+        f"    import sys; print('{FALHOU}{modulo}:', repr(e), file=sys.stderr)\n"
+        for modulo in DIFERIDOS)
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=ambiente,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    linhas = processo.stderr.splitlines()
+    if processo.returncode != 0:
+        # A importação da aplicação falhou: o tempo registado não é representativo
+        print("\n".join(linha for linha in linhas if not linha.startswith("import time:")))
+        print(f"❌ A importação de '{MODULO}' falhou.")
+        sys.exit(1)
+    return linhas
+
+
+def analisar(linhas):
+    # Devolve (cumulativo do módulo, [(dependência, cumulativo)], [(módulo, próprio)],
+    # [(importado depois do módulo, cumulativo)]), em µs. O -X importtime
+    # escreve cada módulo depois dos que importou, indentado por nível.
+    filhos, diretas, proprios, depois, total = [], None, [], [], None
+    for linha in linhas:
+        correspondencia = LINHA.search(linha)
+        if correspondencia is None:
+            continue
+        proprio, cumulativo, indentacao, nome = correspondencia.groups()
+        nivel = (len(indentacao) - 1) // 2
+        if total is None:
+            proprios.append((nome, int(proprio)))
+        if nivel == 1:
+            filhos.append((nome, int(cumulativo)))
+        elif nivel == 0:
+            if total is not None:
+                depois.append((nome, int(cumulativo)))
+            elif nome == MODULO:
+                diretas, total = filhos, int(cumulativo)
+            filhos = []
+    return total, diretas or [], proprios, depois
+
+
+def main():
+    argumentos = sys.argv[1:]
+    top = 15
+    if "--top" in argumentos:
+        indice = argumentos.index("--top")
+        top = int(argumentos[indice + 1])
+        del argumentos[indice:indice + 2]
+    if argumentos:
+        with open(argumentos[0], encoding="utf-8", errors="replace") as ficheiro:
+            linhas = ficheiro.read().splitlines()
+    else:
+        linhas = recolher()
+
+    total, diretas, proprios, diferidos = analisar(linhas)
+    falhas = [linha[len(FALHOU):] for linha in linhas if linha.startswith(FALHOU)]
+    if total is None:
+        print(f"❌ Importação de '{MODULO}' não encontrada no registo.")
+        sys.exit(1)
+    print(f"Importação de {MODULO}: {total / 1000:.1f} ms")
+    print(f"\n{'dependência direta':<32} {'ms':>9} {'%':>6}")
+    for nome, cumulativo in sorted(diretas, key=lambda x: -x[1])[:top]:
+        print(f"{nome:<32} {cumulativo / 1000:>9.1f} {cumulativo / total:>6.1%}")
+    print(f"\n{'módulo (tempo próprio)':<32} {'ms':>9}")
+    for nome, proprio in sorted(proprios, key=lambda x: -x[1])[:top]:
+        print(f"{nome:<32} {proprio / 1000:>9.1f}")
+    if diferidos:
+        print(f"\n{'diferido até ao primeiro uso':<32} {'ms':>9}")
+        for nome, cumulativo in diferidos:
+            print(f"{nome:<32} {cumulativo / 1000:>9.1f}")
+    for falha in falhas:
+        print(f"⚠️ Importação diferida falhou: {falha}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import re
+from collections import namedtuple
+
+# Descrição de um tópico MQTT: campo no estado do aviário, parser do payload,
+# unidade e intervalo de valores válidos (None quando não se aplica).
+Topico = namedtuple("Topico", ["campo", "parser", "unidade", "minimo", "maximo"])
+
+# Expressões compiladas uma só vez; os parsers devolvem None para payloads
+# malformados em vez de lançar exceções.
+_RE_DECIMAL = re.compile(r"\s*[-+]?(?:\d+(?:\.\d*)?|\.\d+)\s*")
+_RE_INTEIRO = re.compile(r"\s*[-+]?\d+\s*")
+
+def ler_decimal(payload):
+    return float(payload) if _RE_DECIMAL.fullmatch(payload) else None
+
+def ler_inteiro(payload):
+    return int(payload) if _RE_INTEIRO.fullmatch(payload) else None
+
+def ler_binario(payload):
+    return bool(int(payload)) if _RE_INTEIRO.fullmatch(payload) else None
+
+# --- Registo de Tópicos ---
+# Para adicionar um sensor basta acrescentar uma entrada: a subscrição e o
+# processamento das mensagens usam esta tabela diretamente.
+TOPICOS = {
+    "aviario/temperatura": Topico("temperatura", ler_decimal, "ºC", -40.0, 85.0),
+    "aviario/humidade": Topico("humidade", ler_decimal, "%", 0.0, 100.0),
+    "aviario/luminosidade": Topico("luminosidade", ler_inteiro, None, 0, 65535),
+    "aviario/gas": Topico("gas", ler_binario, None, None, None),
+    "aviario/ventoinha": Topico("ventoinha", ler_binario, None, None, None),
+    "aviario/janela": Topico("janela", ler_binario, None, None, None),
+}
+
+# Tipo de coluna de cada campo, segundo o parser do tópico (usado no cache de histórico)
+TIPO_PARSER = {ler_decimal: "decimal", ler_inteiro: "inteiro", ler_binario: "binario"}
+CAMPOS = {info.campo: TIPO_PARSER[info.parser] for info in TOPICOS.values()}
+
+# --- Vários Aviários ---
+# Cada aviário publica em aviario/<local>/<sensor>; os tópicos originais
+# (aviario/<sensor>) continuam a pertencer ao aviário por omissão.
+PREFIXO = "aviario/"
+TOPICOS_LOCAIS = [f"{PREFIXO}+/{topico[len(PREFIXO):]}" for topico in TOPICOS]
+
+# Devolve (local, tópico do registo); local é None para os tópicos originais
+def separar_local(topico):
+    if topico in TOPICOS or not topico.startswith(PREFIXO):
+        return None, topico
+    local, _, sensor = topico[len(PREFIXO):].partition("/")
+    return local, PREFIXO + sensor
+
+# Devolve (campo, valor, erro); `erro` é None quando o payload é aceite.
+def interpretar(topico, payload):
+    info = TOPICOS.get(topico)
+    if info is None:
+        return None, None, "tópico desconhecido"
+    valor = info.parser(payload)
+    if valor is None:
+        return info.campo, None, "payload inválido"
+    if info.minimo is not None and not info.minimo <= valor <= info.maximo:
+        return info.campo, None, f"valor fora do intervalo [{info.minimo}, {info.maximo}]"
+    return info.campo, valor, None